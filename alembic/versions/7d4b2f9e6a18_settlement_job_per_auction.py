@@ -0,0 +1,32 @@
+"""settlement job per auction
+
+Revision ID: 7d4b2f9e6a18
+Revises: e41f6a0c9d25
+Create Date: 2026-10-18 21:37:52.613408
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d4b2f9e6a18'
+down_revision: Union[str, None] = 'e41f6a0c9d25'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # jobs are now stored with their auctions, active auctions created before get theirs here
+    op.execute(sa.text(
+        "INSERT INTO settlement_job (auction_id, status, attempts, run_at, created_at) "
+        "SELECT id, 'PENDING', 0, end_date, CURRENT_TIMESTAMP FROM auction "
+        "WHERE auction_status = 'ACTIVE' AND id NOT IN (SELECT auction_id FROM settlement_job)"
+    ))
+
+
+def downgrade() -> None:
+    # the jobs are kept, the tracker of the previous version enqueues the same ones again
+    pass
@@ -0,0 +1,126 @@
+# usage (from the repository root): python -m benchmarks.bench_async_bidding
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# run against a throwaway SQLite file unless DB_URL points somewhere else
+os.environ.setdefault("DB_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+from sqlalchemy import event
+from sqlalchemy.util import await_only
+
+import repos.auction_repo
+import repos.user_repo
+import services.auction_service
+from db_management.database import Base, engine, session_maker, async_engine, async_session_maker
+from db_management.models import Auction, Bid, Category, Product, User
+from utils.constants import AuctionType, UserAccountType
+
+CONCURRENCY = [10, 50, 100]
+DB_LATENCY = 0.002  # simulated network round-trip to the database, per statement
+PROBE_INTERVAL = 0.001
+
+
+def simulate_latency(statement):
+    time.sleep(DB_LATENCY)
+
+
+# the sqlite trace callback runs in the thread executing the statement, like a real network wait would:
+# on the event loop for the sync engine, in the driver thread for aiosqlite
+@event.listens_for(engine, "connect")
+def add_latency_sync(dbapi_connection, connection_record):
+    dbapi_connection.set_trace_callback(simulate_latency)
+
+
+@event.listens_for(async_engine.sync_engine, "connect")
+def add_latency_async(dbapi_connection, connection_record):
+    await_only(dbapi_connection.driver_connection.set_trace_callback(simulate_latency))
+
+
+# the blocking hot path as it was before the async session was introduced
+async def legacy_place_bid(auction_id: int, user_id: int, amount: float) -> None:
+    with session_maker() as session:
+        user = repos.user_repo.get_by_id(session, user_id)
+        auction = repos.auction_repo.get_auction_by_id(session, auction_id)
+        assert not repos.auction_repo.is_user_participating_in_different_active_bid(session, auction, user)
+        new_bid_value = auction.bid.current_bid_value + amount
+        # plain update of the winner, flushed on commit
+        auction.bid.current_bid_value = new_bid_value
+        auction.bid.current_bid_winner = user
+        repos.auction_repo.add_bid_participant(session, auction, user)
+        repos.auction_repo.create_bid_history_entry(session, auction, user, amount)
+        repos.user_repo.set_frozen_balance(user, new_bid_value)
+        session.commit()
+
+
+async def async_place_bid(auction_id: int, user_id: int, amount: float) -> None:
+    async with async_session_maker() as session:
+        await services.auction_service.place_bid(session, auction_id, user_id, amount)
+
+
+def seed(count: int) -> list[tuple[int, int]]:
+    with session_maker() as session:
+        category = Category(name=f"Bench {time.time_ns()}", description="Bench")
+        seller = User(username=f"seller{time.time_ns()}", email=f"seller{time.time_ns()}@bench", password_hash="-",
+                      account_type=UserAccountType.BUSINESS)
+        product = Product(name="Bench", description="Bench", category=category)
+        pairs = []
+        for _ in range(count):
+            auction = Auction(auction_type=AuctionType.BID, end_date=datetime.now() + timedelta(days=1),
+                              product=product, seller=seller, bid=Bid(current_bid_value=1))
+            bidder = User(username=f"bidder{time.time_ns()}", email=f"bidder{time.time_ns()}@bench",
+                          password_hash="-", balance_total=1000)
+            session.add_all([auction, bidder])
+            pairs.append((auction, bidder))
+        session.commit()
+        return [(auction.id, bidder.id) for auction, bidder in pairs]
+
+
+# measures how late a 1 ms timer fires, i.e. how long any other request would wait for the event loop
+async def probe(stop: asyncio.Event, lags: list[float]) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(time.perf_counter() - start - PROBE_INTERVAL)
+
+
+async def run(place_bid, concurrency: int) -> tuple[list[float], list[float]]:
+    pairs = seed(concurrency)
+    latencies, lags = [], []
+
+    # latency is measured from the moment all bids arrive, like a client would see it
+    async def timed_bid(auction_id: int, user_id: int, start: float):
+        await place_bid(auction_id, user_id, 5)
+        latencies.append(time.perf_counter() - start)
+
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(stop, lags))
+    start = time.perf_counter()
+    await asyncio.gather(*(timed_bid(auction_id, user_id, start) for auction_id, user_id in pairs))
+    stop.set()
+    await probe_task
+    return latencies, lags
+
+
+def p99(values: list[float]) -> float:
+    return statistics.quantiles(values, n=100)[98] * 1000 if len(values) > 1 else values[0] * 1000
+
+
+async def main():
+    Base.metadata.create_all(engine)
+
+    print(f"{'mode':>6} | {'bids':>5} | {'bid p50 (ms)':>12} | {'bid p99 (ms)':>12} | {'loop lag p99 (ms)':>17}")
+    for concurrency in CONCURRENCY:
+        for mode, place_bid in (("sync", legacy_place_bid), ("async", async_place_bid)):
+            latencies, lags = await run(place_bid, concurrency)
+            print(f"{mode:>6} | {concurrency:>5} | {statistics.median(latencies) * 1000:>12.1f} | "
+                  f"{p99(latencies):>12.1f} | {p99(lags):>17.1f}")
+
+    await async_engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+# usage (from the repository root): python -m benchmarks.bench_participation_check
+import os
+import statistics
+import time
+from datetime import datetime, timedelta
+
+# run against a throwaway in-memory database unless DB_URL points somewhere else
+os.environ.setdefault("DB_URL", "sqlite://")
+
+import repos.auction_repo
+from db_management.database import Base, engine, session_maker
+from db_management.models import Auction, Bid, BidParticipant, Category, Product, User
+from utils.constants import AuctionType, AuctionStatus
+
+HISTORY_LENGTHS = [0, 10, 100, 1000, 5000]
+REPEATS = 50
+LEGACY_REPEATS = 3
+
+
+# the loop that used to live in repos.auction_repo, kept here for comparison
+def legacy_check(session, auction, user) -> bool:
+    for bid_participant in session.query(BidParticipant).where(BidParticipant.user_id == user.id).all():
+        loop_auction = repos.auction_repo.get_auction_by_bid_id(session, bid_participant.bid_id)
+        if loop_auction is None or loop_auction.id == auction.id:
+            continue
+        if not loop_auction.is_auction_finished:
+            return True
+    return False
+
+
+def create_auction(session, seller, product, end_date, status) -> Auction:
+    auction = Auction(auction_type=AuctionType.BID, auction_status=status, end_date=end_date, product=product,
+                      seller=seller, bid=Bid(current_bid_value=1))
+    session.add(auction)
+    return auction
+
+
+def seed(session, history_length: int) -> tuple[Auction, User]:
+    seller = User(username=f"seller{history_length}", email=f"seller{history_length}@bench", password_hash="-")
+    bidder = User(username=f"bidder{history_length}", email=f"bidder{history_length}@bench", password_hash="-")
+    product = Product(name="Bench", description="Bench", category=session.query(Category).first())
+    session.add_all([seller, bidder, product])
+
+    # finished auctions the user has bid on in the past
+    for _ in range(history_length):
+        past = create_auction(session, seller, product, datetime.now() - timedelta(days=1), AuctionStatus.INACTIVE)
+        session.add(BidParticipant(bid=past.bid, user=bidder))
+
+    current = create_auction(session, seller, product, datetime.now() + timedelta(days=1), AuctionStatus.ACTIVE)
+    session.commit()
+    return current, bidder
+
+
+def measure(check, session, auction, user, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        assert check(session, auction, user) is False
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    Base.metadata.create_all(engine)
+    with session_maker() as session:
+        session.add(Category(name="Bench", description="Bench"))
+        session.commit()
+
+        print(f"{'history':>8} | {'single query (ms)':>18} | {'legacy loop (ms)':>17}")
+        for history_length in HISTORY_LENGTHS:
+            auction, user = seed(session, history_length)
+            new = measure(repos.auction_repo.is_user_participating_in_different_active_bid, session, auction, user,
+                          REPEATS)
+            legacy = measure(legacy_check, session, auction, user, LEGACY_REPEATS)
+            print(f"{history_length:>8} | {new:>18.3f} | {legacy:>17.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,21 @@
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Header, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 import repos.auction_repo
 import repos.stats_repo
 import repos.user_repo
 import services.auction_service
+import services.metrics_service
 from db_management import dto
-from db_management.database import get_db
-from db_management.dto import PlaceBid
-from response_models.auth_responses import validate_auth_jwt
+from db_management.database import get_db, get_async_db
+from db_management.dto import PlaceBid, PlaceProxyBid
+from response_models.auth_responses import validate_auth_jwt, admin_required
+from services.auction_cache_service import get_auction_cache
+from services.idempotency_service import get_idempotency_store
+from tasks.auction_finished_task import get_expiry_tracker
 
 router = APIRouter(
     prefix="/auction",
@@ -18,27 +23,26 @@ router = APIRouter(
 )
 
 db_dependency = Annotated[Session, Depends(get_db)]
+async_db_dependency = Annotated[AsyncSession, Depends(get_async_db)]
 user_dependency = Annotated[dict, Depends(validate_auth_jwt)]
+admin_dependency = Annotated[dict, Depends(admin_required)]
+idempotency_key_header = Annotated[str | None, Header(alias="Idempotency-Key")]
 
 
 @router.get("/id/{auction_id}", status_code=status.HTTP_200_OK)
 async def get_auction(auction_id: int, db: db_dependency):
-    auction = repos.auction_repo.get_full_auction_by_id(db, auction_id)
-    if auction is None:
-        raise HTTPException(status_code=404, detail="Auction not found")
-
-    return auction.to_public()
+    return services.auction_service.get_auction(db, auction_id)
 
 
 @router.get("/last", status_code=status.HTTP_200_OK)
-async def get_last_auctions(db: db_dependency):
-    products = repos.auction_repo.get_latest_auctions(db, 9)
+async def get_last_auctions(db: db_dependency, active_only: bool = False):
+    products = repos.auction_repo.get_latest_auctions(db, 9, active_only)
     return {"products": [product.to_public() for product in products]}
 
 
 @router.post("/search", status_code=status.HTTP_200_OK)
 async def search_auctions(dto: dto.SearchAuctions, db: db_dependency):
-    auctions = repos.auction_repo.search_auctions_by_name(db, dto.keyword)
+    auctions = repos.auction_repo.search_auctions_by_name(db, dto.keyword, dto.active_only)
     if not auctions:
         raise HTTPException(status_code=404, detail="No auctions found")
     return {"auctions": [auction.to_public() for auction in auctions]}
@@ -54,24 +58,40 @@ async def create_auction(auction: dto.CreateAuction, user: user_dependency, db:
 @router.delete("", status_code=status.HTTP_200_OK)
 async def delete_auction(dto: dto.DeleteAuction, db: db_dependency):
     repos.auction_repo.delete_auction(db, dto.auction_id)
+    get_auction_cache().invalidate(dto.auction_id)
+    get_expiry_tracker().untrack(dto.auction_id)
     return {"message": "Auction deleted successfully"}
 
 
 @router.post("/bid", status_code=status.HTTP_200_OK)
-async def place_bid(dto: PlaceBid, user: user_dependency, db: db_dependency):
-    await services.auction_service.place_bid(db, dto.auction_id, user['id'], dto.bid_value)
-    return {"message": "Bid placed successfully"}
+async def place_bid(dto: PlaceBid, user: user_dependency, db: async_db_dependency,
+                    idempotency_key: idempotency_key_header = None):
+    async def action():
+        await services.auction_service.place_bid(db, dto.auction_id, user['id'], dto.bid_value)
+        return {"message": "Bid placed successfully"}
+
+    return await get_idempotency_store().execute(idempotency_key, user['id'], "bid", dto.dict(), action)
+
+
+@router.post("/proxy_bid", status_code=status.HTTP_200_OK)
+async def place_proxy_bid(dto: PlaceProxyBid, user: user_dependency, db: async_db_dependency):
+    await services.auction_service.place_proxy_bid(db, dto.auction_id, user['id'], dto.max_bid_value)
+    return {"message": "Proxy bid placed successfully"}
 
 
 @router.post("/buy_now", status_code=status.HTTP_200_OK)
-async def buy_now(dto: dto.BuyNow, user: user_dependency, db: db_dependency):
-    services.auction_service.buy_now(db, dto.auction_id, user['id'])
-    return {"message": "Product bought successfully"}
+async def buy_now(dto: dto.BuyNow, user: user_dependency, db: async_db_dependency,
+                  idempotency_key: idempotency_key_header = None):
+    async def action():
+        await services.auction_service.buy_now(db, dto.auction_id, user['id'])
+        return {"message": "Product bought successfully"}
+
+    return await get_idempotency_store().execute(idempotency_key, user['id'], "buy_now", dto.dict(), action)
 
 
 @router.get("/category/{category_id}", status_code=status.HTTP_200_OK)
-async def get_auctions_by_category(category_id: int, db: db_dependency):
-    auctions = repos.auction_repo.get_auction_list_by_category(db, category_id)
+async def get_auctions_by_category(category_id: int, db: db_dependency, active_only: bool = False):
+    auctions = repos.auction_repo.get_auction_list_by_category(db, category_id, active_only)
     if not auctions:
         raise HTTPException(status_code=404, detail="No auctions found")
     return {"auctions": [auction.to_public() for auction in auctions]}
@@ -80,3 +100,8 @@ async def get_auctions_by_category(category_id: int, db: db_dependency):
 @router.get("/stats/{auction_id}", status_code=status.HTTP_200_OK)
 async def get_auctions_stats(auction_id: int, db: db_dependency):
     return services.auction_service.auction_stats(db, auction_id)
+
+
+@router.get("/metrics", status_code=status.HTTP_200_OK)
+async def get_auction_metrics(admin: admin_dependency):
+    return services.metrics_service.get_metrics().snapshot()
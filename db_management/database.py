@@ -1,20 +1,46 @@
 import os
 from typing import Any
+from typing import AsyncGenerator
 from typing import Generator
 
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Session
 from sqlalchemy.orm import sessionmaker
 
+# async drivers used when ASYNC_DB_URL is not set explicitly
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def to_async_url(url: str) -> str:
+    """
+    Returns the same database URL with the driver replaced by its asyncio counterpart (e.g. mysql -> mysql+aiomysql).
+    """
+    parsed = make_url(url)
+    return parsed.set(drivername=ASYNC_DRIVERS.get(parsed.get_backend_name(), parsed.drivername)) \
+        .render_as_string(hide_password=False)
+
+
 load_dotenv()
 DB_URL = os.getenv("DB_URL")
+ASYNC_DB_URL = os.getenv("ASYNC_DB_URL") or to_async_url(DB_URL)
 
-engine = create_engine(DB_URL, echo=False, pool_pre_ping=True, pool_recycle=3600,
-                       isolation_level="AUTOCOMMIT")  # reconect after 1 hour
+engine = create_engine(DB_URL, echo=False, pool_pre_ping=True, pool_recycle=3600)  # reconect after 1 hour
 session_maker = sessionmaker(bind=engine, expire_on_commit=False)
 
+# used by the bidding hot path, so a slow database round-trip does not stall the event loop
+# not autocommit, a bid's compare-and-swap commits or rolls back together with everything written after it
+async_engine = create_async_engine(ASYNC_DB_URL, echo=False, pool_pre_ping=True, pool_recycle=3600)
+async_session_maker = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
 
 def create_db() -> None:
     """
@@ -31,5 +57,13 @@ def get_db() -> Generator[Session, Any, None]:
         yield session
 
 
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Returns an async generator that yields a SQLAlchemy AsyncSession. Used by endpoints whose whole database path is awaited.
+    """
+    async with async_session_maker() as session:
+        yield session
+
+
 Base = declarative_base()
 print("Database connection established")
@@ -2,20 +2,23 @@ import os
 
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
-from db_management.database import Base, get_db
+from db_management.database import Base, get_db, get_async_db, to_async_url
 from main import app
 
 load_dotenv()
 DB_URL = os.getenv("TEST_DB_URL")
 
-engine = create_engine(DB_URL, echo=False, pool_pre_ping=True, pool_recycle=3600,
-                       isolation_level="AUTOCOMMIT")  # reconect after 1 hour
+engine = create_engine(DB_URL, echo=False, pool_pre_ping=True, pool_recycle=3600)  # reconect after 1 hour
 session_maker = sessionmaker(bind=engine, expire_on_commit=False)
 
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(to_async_url(DB_URL), echo=False, pool_pre_ping=True, pool_recycle=3600)
+TestingAsyncSessionLocal = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
 Base.metadata.drop_all(bind=engine)
 Base.metadata.create_all(bind=engine)
 
@@ -28,5 +31,11 @@ def override_get_db():
         db.close()
 
 
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_async_db] = override_get_async_db
 print("Test database connection established")
@@ -60,6 +60,7 @@ class GetAuction(BaseModel):
 
 class SearchAuctions(BaseModel):
     keyword: str = Field(description="Search term")
+    active_only: bool = Field(default=False, description="Leave out finished auctions")
 
 
 class DeleteAuction(BaseModel):
@@ -71,6 +72,11 @@ class PlaceBid(BaseModel):
     bid_value: float = Field(ge=0.1, description="Bid value")
 
 
+class PlaceProxyBid(BaseModel):
+    auction_id: int = Field(description="ID of auction")
+    max_bid_value: float = Field(ge=0.1, description="Highest total bid value to place automatically")
+
+
 class BuyNow(BaseModel):
     auction_id: int = Field(description="ID of auction")
 
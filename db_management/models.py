@@ -1,7 +1,8 @@
 from datetime import datetime
 from typing import List
 
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, FLOAT, func
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, FLOAT, func, Index, Boolean, UniqueConstraint, \
+    and_, or_, false
 from sqlalchemy import Enum as SQLAlchemyEnum
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship, mapped_column, Mapped, declared_attr
@@ -146,6 +147,9 @@ class Bid(Base):
 
     current_bid_value = Column(FLOAT, nullable=False)
 
+    # bumped on every winner change, used for compare-and-swap updates between workers
+    version = Column(Integer, nullable=False, default=0, server_default='0')
+
     current_bid_winner_id = Column(Integer, ForeignKey('user.id'))
     current_bid_winner = relationship('User')
     bidders = relationship('BidParticipant', back_populates='bid')  # Store all bidders
@@ -174,6 +178,10 @@ class BidParticipant(Base):
 
     created_at = Column(DateTime, nullable=False, default=datetime.now)  # When the user placed the bid
 
+    __table_args__ = (
+        Index('ix_bid_participant_user_id_bid_id', 'user_id', 'bid_id'),
+    )
+
 
 class BidHistory(Base):
     __tablename__ = 'bid_history'
@@ -188,6 +196,69 @@ class BidHistory(Base):
     created_at = Column(DateTime, nullable=False, default=datetime.now)  # When the user placed the bid
 
 
+class ProxyBid(Base):
+    __tablename__ = 'proxy_bid'
+
+    id = Column(Integer, primary_key=True, index=True)
+    bid_id = Column(Integer, ForeignKey('bid.id'), nullable=False)
+    bid = relationship('Bid')
+    user_id = Column(Integer, ForeignKey('user.id'), nullable=False)
+    user = relationship('User')
+
+    max_amount = Column(FLOAT, nullable=False)  # Highest total bid value the server may place for the user
+    active = Column(Boolean, nullable=False, default=True)  # False once outbid above the maximum
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
+
+    __table_args__ = (
+        UniqueConstraint('bid_id', 'user_id', name='uq_proxy_bid_bid_id_user_id'),
+    )
+
+    def __str__(self):
+        return f"ProxyBid: [bid: {self.bid_id} user: {self.user_id} max: {self.max_amount} active: {self.active}]"
+
+    def to_public(self) -> dict:
+        return {
+            "id": self.id,
+            "max_amount": self.max_amount,
+            "active": self.active,
+            "created_at": self.created_at
+        }
+
+
+# durable settlement of an ended auction, claimed by one node at a time
+class SettlementJob(Base):
+    __tablename__ = 'settlement_job'
+
+    id = Column(Integer, primary_key=True, index=True)
+    auction_id = Column(Integer, ForeignKey('auction.id', ondelete='CASCADE'), nullable=False, unique=True)
+    status = Column(SQLAlchemyEnum(SettlementJobStatus), nullable=False, default=SettlementJobStatus.PENDING)
+    attempts = Column(Integer, nullable=False, default=0)
+    run_at = Column(DateTime, nullable=False, default=datetime.now)  # Not claimed before this time
+    locked_by = Column(String(255), nullable=True)  # Node running the job
+    locked_until = Column(DateTime, nullable=True)  # Job is free to claim again after this time
+    last_error = Column(String(1024), nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
+
+    __table_args__ = (
+        Index('ix_settlement_job_status_run_at', 'status', 'run_at'),
+    )
+
+    def __str__(self):
+        return f"SettlementJob: [auction: {self.auction_id} status: {self.status} attempts: {self.attempts} run at: {self.run_at}]"
+
+
+# named lease held by at most one node at a time, used for leader election
+class LeaderLease(Base):
+    __tablename__ = 'leader_lease'
+
+    name = Column(String(64), primary_key=True)
+    holder = Column(String(255), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+    def __str__(self):
+        return f"LeaderLease: [{self.name} held by {self.holder} until {self.expires_at}]"
+
+
 class Auction(Base):
     __tablename__ = 'auction'
 
@@ -205,6 +276,10 @@ class Auction(Base):
     bid = relationship('Bid')
 
     buy_now_price = Column(FLOAT, nullable=True)
+    # set by the node that sends the ending soon reminder, every other node tracking the auction skips it
+    ending_soon_sent = Column(Boolean, nullable=False, default=False, server_default=false())
+    # seq of the last event announced to the auction room, taken by the transaction making the change
+    event_seq = Column(Integer, nullable=False, default=0, server_default='0')
 
     seller_id: Mapped[int] = mapped_column(ForeignKey("user.id"))
     seller: Mapped["User"] = relationship(back_populates="products_sold", foreign_keys=[seller_id])
@@ -212,6 +287,10 @@ class Auction(Base):
     buyer_id: Mapped[int] = mapped_column(ForeignKey("user.id"), nullable=True)
     buyer: Mapped["User"] = relationship(back_populates="products_bought", foreign_keys=[buyer_id])
 
+    __table_args__ = (
+        Index('ix_auction_auction_status_end_date', 'auction_status', 'end_date'),
+    )
+
     @hybrid_property
     def is_auction_finished(self) -> bool:
         # Auction is finished if just expired
@@ -221,12 +300,34 @@ class Auction(Base):
         if self.auction_status != AuctionStatus.ACTIVE:
             return True
 
-        # Auction is finished if buyer is set in buy now auction
+        # Auction is finished if buyer is set in buy now auction (the id is checked, no lazy load of the buyer)
         if self.auction_type == AuctionType.BUY_NOW:
-            return self.buyer is not None
+            return self.buyer_id is not None
 
         return False
 
+    # same rules in sql, now is bound when the query is built
+    @is_auction_finished.expression
+    def is_auction_finished(cls):
+        return or_(
+            cls.end_date < datetime.now(),
+            cls.auction_status != AuctionStatus.ACTIVE,
+            and_(cls.auction_type == AuctionType.BUY_NOW, cls.buyer_id.is_not(None)),
+        )
+
+    # negation of is_auction_finished, written positively so the (auction_status, end_date) index can serve it
+    @hybrid_property
+    def is_auction_live(self) -> bool:
+        return not self.is_auction_finished
+
+    @is_auction_live.expression
+    def is_auction_live(cls):
+        return and_(
+            cls.auction_status == AuctionStatus.ACTIVE,
+            cls.end_date >= datetime.now(),
+            or_(cls.auction_type != AuctionType.BUY_NOW, cls.buyer_id.is_(None)),
+        )
+
     @hybrid_property
     def get_buyer(self):
         if self.auction_type == AuctionType.BUY_NOW:
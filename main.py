@@ -1,5 +1,6 @@
 import asyncio
 import os
+from datetime import datetime
 
 import cloudinary
 import stripe
@@ -14,7 +15,9 @@ from controllers import auth_controller, user_controller, category_controller, a
     file_upload_controller
 from db_management import models
 from db_management.database import engine
-from tasks.auction_finished_task import scheduler, reload_tracked_auctions, check_auctions
+from services.outbox_service import get_outbox
+from tasks.auction_finished_task import get_expiry_tracker, reload_tracked_auctions
+from tasks.settlement_task import get_settlement_runner
 from utils.constants import fastapi_logger as logger
 
 app = FastAPI()
@@ -37,8 +40,28 @@ app.add_middleware(
     expose_headers=["*"]
 )
 
-app.add_event_handler('startup', lambda: (reload_tracked_auctions(), check_auctions(), scheduler.start()))
-app.add_event_handler('shutdown', lambda: (scheduler.shutdown()))
+
+def on_startup():
+    get_outbox().start()
+
+    # auctions that ended while the server was down are caught up with by the leader, the rest are tracked
+    # so the leader is woken up at their end dates
+    started_at = datetime.now()
+    reload_tracked_auctions(ends_after=started_at)
+    get_expiry_tracker().start()
+    get_settlement_runner().start_catch_up(ended_before=started_at)
+    get_settlement_runner().start()
+
+
+async def on_shutdown():
+    get_expiry_tracker().stop()
+    get_settlement_runner().stop()
+    # stopped last, the tasks above hand notifications over to it until they are stopped
+    await get_outbox().stop()
+
+
+app.add_event_handler('startup', on_startup)
+app.add_event_handler('shutdown', on_shutdown)
 
 models.Base.metadata.create_all(bind=engine)
 
@@ -0,0 +1,152 @@
+from datetime import datetime
+
+from sqlalchemy import select, update, func, Row
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload, object_session
+from sqlalchemy.orm.attributes import set_committed_value
+
+import repos.auction_repo
+from db_management.models import Auction, Product, User, Bid, BidHistory, BidParticipant, ProxyBid
+from utils.constants import AuctionStatus
+
+
+# relationships are never lazy loaded on an AsyncSession, everything used by the bidding path is loaded here
+async def get_auction_by_id(session: AsyncSession, auction_id: int) -> Auction | None:
+    return (await session.scalars(select(Auction).options(
+        selectinload(Auction.product),
+        selectinload(Auction.bid).selectinload(Bid.current_bid_winner),
+        selectinload(Auction.seller),
+        selectinload(Auction.buyer)
+    ).where(Auction.id == auction_id))).first()
+
+
+async def get_full_auction_by_id(session: AsyncSession, auction_id: int) -> Auction | None:
+    return (await session.scalars(select(Auction).options(
+        selectinload(Auction.product).selectinload(Product.category),
+        selectinload(Auction.bid).selectinload(Bid.bidders).selectinload(BidParticipant.user),
+        selectinload(Auction.bid).selectinload(Bid.current_bid_winner),
+        selectinload(Auction.seller),
+        selectinload(Auction.buyer)
+    ).where(Auction.id == auction_id))).first()
+
+
+async def get_total_bids(session: AsyncSession, bid_id: int) -> int:
+    return await session.scalar(select(func.count(BidHistory.id)).where(BidHistory.bid_id == bid_id))
+
+
+# live state of the auction and the seq of the last event it includes, read together in a single query
+async def get_auction_snapshot(session: AsyncSession, auction_id: int) -> Row | None:
+    bid_count = select(func.count(BidHistory.id)).where(BidHistory.bid_id == Auction.bid_id).scalar_subquery()
+    return (await session.execute(select(
+        Auction.id, Auction.auction_type, Auction.auction_status, Auction.seller_id, Auction.end_date,
+        Auction.buy_now_price, Auction.buyer_id, Bid.current_bid_value, Bid.current_bid_winner_id,
+        bid_count.label("bid_count"), Auction.event_seq
+    ).outerjoin(Bid, Auction.bid_id == Bid.id).where(Auction.id == auction_id))).first()
+
+
+# same statement as the sync repo, run on the connection of the async session
+async def increment_event_seq(session: AsyncSession, auction_id: int, count: int = 1) -> int | None:
+    return await session.run_sync(repos.auction_repo.increment_event_seq, auction_id, count)
+
+
+async def is_user_bid_participant(session: AsyncSession, auction: Auction, user: User) -> bool:
+    if not object_session(auction) or not object_session(user):
+        raise ValueError("Both auction and user must be attached to a session")
+
+    return (await session.scalars(select(BidParticipant.id).where(
+        BidParticipant.bid_id == auction.bid.id, BidParticipant.user_id == user.id
+    ))).first() is not None
+
+
+# make sure the user is not participating in a different active auction
+async def is_user_participating_in_different_active_bid(session: AsyncSession, auction: Auction, user: User) -> bool:
+    if not object_session(auction) or not object_session(user):
+        raise ValueError("Both auction and user must be attached to a session")
+
+    return (await session.scalars(
+        select(BidParticipant.id)
+        .join(Auction, Auction.bid_id == BidParticipant.bid_id)
+        .where(BidParticipant.user_id == user.id,
+               Auction.id != auction.id,
+               Auction.auction_status == AuctionStatus.ACTIVE,
+               Auction.end_date >= datetime.now())
+    )).first() is not None
+
+
+def create_bid_history_entry(session: AsyncSession, auction: Auction, user: User, amount: float) -> None:
+    if not object_session(auction) or not object_session(user):
+        raise ValueError("Both auction and user must be attached to a session")
+
+    bid_history_entry = BidHistory(
+        bid=auction.bid,
+        user=user,
+        amount=amount
+    )
+    session.add(bid_history_entry)
+
+
+async def add_bid_participant(session: AsyncSession, auction: Auction, user: User) -> None:
+    if not object_session(auction) or not object_session(user):
+        raise ValueError("Both auction and user must be attached to a session")
+
+    if not await is_user_bid_participant(session, auction, user):
+        bid_participant = BidParticipant(
+            bid=auction.bid,
+            user=user
+        )
+        session.add(bid_participant)
+
+
+# compare-and-swap the bid winner, returns False if the bid was changed by someone else since it was loaded
+async def update_bid_winner(session: AsyncSession, auction: Auction, user: User, amount: float) -> bool:
+    if not object_session(auction) or not object_session(user):
+        raise ValueError("Both auction and user must be attached to a session")
+
+    bid = auction.bid
+    # swap before anything pending is flushed, so a lost race writes nothing
+    with session.no_autoflush:
+        result = await session.execute(
+            update(Bid)
+            .where(Bid.id == bid.id, Bid.version == bid.version)
+            .values(current_bid_value=amount, current_bid_winner_id=user.id, version=Bid.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+    if result.rowcount != 1:
+        return False
+
+    # sync the loaded bid without marking it dirty (it would be updated again on flush)
+    set_committed_value(bid, 'current_bid_value', amount)
+    set_committed_value(bid, 'current_bid_winner_id', user.id)
+    set_committed_value(bid, 'current_bid_winner', user)
+    set_committed_value(bid, 'version', bid.version + 1)
+    return True
+
+
+async def get_proxy_bid(session: AsyncSession, bid_id: int, user_id: int) -> ProxyBid | None:
+    return (await session.scalars(
+        select(ProxyBid).where(ProxyBid.bid_id == bid_id, ProxyBid.user_id == user_id)
+    )).first()
+
+
+# active proxy bids of the auction, oldest first (the older one wins a tie)
+async def get_active_proxy_bids(session: AsyncSession, bid_id: int) -> list[ProxyBid]:
+    return list(await session.scalars(select(ProxyBid).options(
+        selectinload(ProxyBid.user)
+    ).where(ProxyBid.bid_id == bid_id, ProxyBid.active.is_(True)).order_by(ProxyBid.created_at, ProxyBid.id)))
+
+
+async def set_proxy_bid(session: AsyncSession, auction: Auction, user: User, max_amount: float) -> ProxyBid:
+    if not object_session(auction) or not object_session(user):
+        raise ValueError("Both auction and user must be attached to a session")
+
+    proxy_bid = await get_proxy_bid(session, auction.bid.id, user.id)
+    if proxy_bid is None:
+        proxy_bid = ProxyBid(
+            bid=auction.bid,
+            user=user
+        )
+        session.add(proxy_bid)
+
+    proxy_bid.max_amount = max_amount
+    proxy_bid.active = True
+    return proxy_bid
@@ -0,0 +1,9 @@
+from datetime import datetime
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import repos.settlement_repo
+
+
+async def move_pending_job(session: AsyncSession, auction_id: int, run_at: datetime) -> bool:
+    return await session.run_sync(repos.settlement_repo.move_pending_job, auction_id, run_at)
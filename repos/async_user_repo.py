@@ -0,0 +1,13 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from db_management.models import User
+
+
+async def get_by_id(session: AsyncSession, user_id: int) -> User | None:
+    return (await session.scalars(select(User).where(User.id == user_id).options(
+        selectinload(User.products_bought),
+        selectinload(User.products_sold),
+        selectinload(User.billing_details)
+    ))).first()
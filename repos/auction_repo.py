@@ -1,9 +1,11 @@
+from datetime import datetime
+
+from sqlalchemy import update, select, func
 from sqlalchemy.orm import selectinload, Session, object_session
 
 from db_management.dto import CreateCategory
-from db_management.models import Auction, Product, Category, User, Bid, BidHistory, BidParticipant
+from db_management.models import Auction, Product, Category, User, Bid, BidHistory, BidParticipant, ProxyBid
 from utils.constants import AuctionStatus
-from utils.constants import fastapi_logger as logger
 
 
 def create_category(session: Session, category: CreateCategory) -> Category | None:
@@ -74,38 +76,119 @@ def get_all_auctions(session: Session) -> list[Auction] | None:
     return session.query(Auction).all()
 
 
+# narrow projection for the expiry tracker, no auction is hydrated
+def get_active_auction_end_dates(session: Session, ends_after: datetime | None = None) -> list[tuple[int, datetime]]:
+    query = select(Auction.id, Auction.end_date).where(
+        Auction.auction_status == AuctionStatus.ACTIVE
+    )
+    if ends_after is not None:
+        query = query.where(Auction.end_date > ends_after)
+    return session.execute(query).all()
+
+
+def _overdue_auctions(ended_before: datetime):
+    return Auction.auction_status == AuctionStatus.ACTIVE, Auction.end_date <= ended_before
+
+
+def count_overdue_auctions(session: Session, ended_before: datetime) -> int:
+    return session.scalar(select(func.count(Auction.id)).where(*_overdue_auctions(ended_before)))
+
+
+# (auction id, winner id) of ended auctions still waiting for settlement, paged by id
+# buy now auctions still active have never been bought, so they have no winner
+def get_overdue_auctions(session: Session, ended_before: datetime, after_id: int,
+                         limit: int) -> list[tuple[int, int | None]]:
+    return session.execute(select(Auction.id, Bid.current_bid_winner_id).outerjoin(
+        Bid, Auction.bid_id == Bid.id
+    ).where(*_overdue_auctions(ended_before), Auction.id > after_id).order_by(Auction.id).limit(limit)).all()
+
+
+# returns the auctions this call has closed with the seq of their auction_ended event,
+# auctions already closed (bought, or by another node) are left out
+def close_auctions(session: Session, auction_ids: list[int]) -> dict[int, int]:
+    return _update_auctions_taking_seqs(session, auction_ids, Auction.auction_status == AuctionStatus.ACTIVE,
+                                        auction_status=AuctionStatus.INACTIVE)
+
+
+# (auction id, end date) of active auctions ending before until whose followers have not been reminded yet
+def get_due_reminders(session: Session, now: datetime, until: datetime) -> list[tuple[int, datetime]]:
+    return session.execute(select(Auction.id, Auction.end_date).where(
+        Auction.auction_status == AuctionStatus.ACTIVE, Auction.ending_soon_sent.is_(False),
+        Auction.end_date > now, Auction.end_date <= until
+    )).all()
+
+
+# returns the auctions whose reminder is left to this node with the seq of the reminder,
+# each reminder is claimed by a single node
+def claim_ending_soon_reminders(session: Session, auction_ids: list[int]) -> dict[int, int]:
+    return _update_auctions_taking_seqs(session, auction_ids, Auction.ending_soon_sent.is_(False),
+                                        ending_soon_sent=True)
+
+
+# updates the auctions still matching the condition, every row this call has changed takes the next seq
+# of its room events, returns {<auction_id>: <seq>}
+def _update_auctions_taking_seqs(session: Session, auction_ids: list[int], condition, **values) -> dict[int, int]:
+    statement = update(Auction).where(condition).values(event_seq=Auction.event_seq + 1, **values) \
+        .execution_options(synchronize_session=False)
+
+    if session.get_bind().dialect.update_returning:
+        return dict(session.execute(statement.where(Auction.id.in_(auction_ids))
+                                    .returning(Auction.id, Auction.event_seq)).all())
+
+    # no UPDATE ... RETURNING (mysql), every auction is updated with its own compare-and-swap update,
+    # the changed row stays locked until commit, so the seq read back is the one written here
+    candidates = session.scalars(select(Auction.id).where(Auction.id.in_(auction_ids), condition)).all()
+    return {auction_id: _get_event_seq(session, auction_id) for auction_id in candidates
+            if session.execute(statement.where(Auction.id == auction_id)).rowcount == 1}
+
+
+# takes the next count seqs of the auction's room events, in the transaction writing the change they announce,
+# returns the last one, None if the auction does not exist
+def increment_event_seq(session: Session, auction_id: int, count: int = 1) -> int | None:
+    statement = update(Auction).where(Auction.id == auction_id).values(event_seq=Auction.event_seq + count) \
+        .execution_options(synchronize_session=False)
+
+    if session.get_bind().dialect.update_returning:
+        return session.scalar(statement.returning(Auction.event_seq))
+
+    # no UPDATE ... RETURNING (mysql), the row stays locked by the update until commit
+    if session.execute(statement).rowcount != 1:
+        return None
+    return _get_event_seq(session, auction_id)
+
+
+def _get_event_seq(session: Session, auction_id: int) -> int:
+    return session.scalar(select(Auction.event_seq).where(Auction.id == auction_id))
+
+
 def get_auction_by_bid_id(session: Session, bid_id: int) -> Auction | None:
     return session.query(Auction).where(Auction.bid_id == bid_id).first()
 
 
-def get_latest_auctions(session: Session, amount: int = 5):
-    return session.query(Auction).options(
+# every listing loads the same relationships, finished auctions are left out in sql
+def _list_auctions(session: Session, active_only: bool):
+    query = session.query(Auction).options(
         selectinload(Auction.product).selectinload(Product.category),
         selectinload(Auction.bid).selectinload(Bid.bidders).selectinload(BidParticipant.user),
         selectinload(Auction.bid).selectinload(Bid.current_bid_winner),
         selectinload(Auction.seller),
         selectinload(Auction.buyer)
-    ).order_by(Auction.created_at.desc()).limit(amount).all()
+    )
+    if active_only:
+        query = query.filter(Auction.is_auction_live)
+    return query
 
 
-def get_auction_list_by_category(session: Session, category_id: int):
-    return session.query(Auction).options(
-        selectinload(Auction.product).selectinload(Product.category),
-        selectinload(Auction.bid).selectinload(Bid.bidders).selectinload(BidParticipant.user),
-        selectinload(Auction.bid).selectinload(Bid.current_bid_winner),
-        selectinload(Auction.seller),
-        selectinload(Auction.buyer)
-    ).join(Product).filter(Product.category_id == category_id).all()
+def get_latest_auctions(session: Session, amount: int = 5, active_only: bool = False):
+    return _list_auctions(session, active_only).order_by(Auction.created_at.desc()).limit(amount).all()
 
 
-def search_auctions_by_name(session: Session, search: str):
-    return session.query(Auction).options(
-        selectinload(Auction.product).selectinload(Product.category),
-        selectinload(Auction.bid).selectinload(Bid.bidders).selectinload(BidParticipant.user),
-        selectinload(Auction.bid).selectinload(Bid.current_bid_winner),
-        selectinload(Auction.seller),
-        selectinload(Auction.buyer)
-    ).join(Product).filter(Product.name.ilike(f"%{search}%")).all()
+def get_auction_list_by_category(session: Session, category_id: int, active_only: bool = False):
+    return _list_auctions(session, active_only).join(Product).filter(Product.category_id == category_id).all()
+
+
+def search_auctions_by_name(session: Session, search: str, active_only: bool = False):
+    return _list_auctions(session, active_only).join(Product).filter(Product.name.ilike(f"%{search}%")).all()
 
 
 def add_user_auction_buyer(auction: Auction, user: User) -> None:
@@ -114,6 +197,12 @@ def add_user_auction_buyer(auction: Auction, user: User) -> None:
     auction.buyer = user
 
 
+def set_auction_end_date(auction: Auction, end_date: datetime) -> None:
+    if not object_session(auction):
+        raise ValueError("Auction must be attached to a session")
+    auction.end_date = end_date
+
+
 def set_auction_status(auction: Auction, status: AuctionStatus) -> None:
     if not object_session(auction):
         raise ValueError("Auction must be attached to a session")
@@ -124,8 +213,8 @@ def is_user_bid_participant(session: Session, auction: Auction, user: User) -> b
     if not object_session(auction) or not object_session(user):
         raise ValueError("Both auction and user must be attached to a session")
 
-    return session.query(BidParticipant).join(BidHistory, BidParticipant.bid_id == BidHistory.bid_id) \
-        .filter(BidParticipant.bid_id == auction.bid.id, BidHistory.user_id == user.id).first() is not None
+    return session.query(BidParticipant.id) \
+        .filter(BidParticipant.bid_id == auction.bid.id, BidParticipant.user_id == user.id).first() is not None
 
 
 # make sure the user is not participating in a different active auction
@@ -133,27 +222,14 @@ def is_user_participating_in_different_active_bid(session: Session, auction: Auc
     if not object_session(auction) or not object_session(user):
         raise ValueError("Both auction and user must be attached to a session")
 
-    # first get all the auctions the user have ever participated in (even if they are finished)
-    user_bid_participant_list = session.query(BidParticipant).where(BidParticipant.user_id == user.id).all()
-    if not user_bid_participant_list:
-        return False
-
-    # iterate over all the auctions the user have ever participated in
-    for bid_participant in user_bid_participant_list:
-        loop_auction = get_auction_by_bid_id(session, bid_participant.bid_id)
-        if not loop_auction:
-            logger.warning(f"User {user.id} is participating in a non-existent auction {bid_participant.bid_id}")
-            continue
-
-        # skip the current auction
-        if loop_auction.id == auction.id:
-            continue
-
-        # check if the auction does not have finished yet
-        if not loop_auction.is_auction_finished:
-            return True
-
-    return False
+    # single lookup through the (user_id, bid_id) index, finished auctions are filtered out by the database
+    return session.query(BidParticipant.id) \
+        .join(Auction, Auction.bid_id == BidParticipant.bid_id) \
+        .filter(BidParticipant.user_id == user.id,
+                Auction.id != auction.id,
+                Auction.auction_status == AuctionStatus.ACTIVE,
+                Auction.end_date >= datetime.now()) \
+        .first() is not None
 
 
 def create_bid_history_entry(session: Session, auction: Auction, user: User, amount: float) -> None:
@@ -180,9 +256,7 @@ def add_bid_participant(session: Session, auction: Auction, user: User) -> None:
         session.add(bid_participant)
 
 
-def update_bid_winner(auction: Auction, user: User, amount: float) -> None:
-    if not object_session(auction) or not object_session(user):
-        raise ValueError("Both auction and user must be attached to a session")
-
-    auction.bid.current_bid_winner = user
-    auction.bid.current_bid_value = amount
+def deactivate_proxy_bid(proxy_bid: ProxyBid) -> None:
+    if not object_session(proxy_bid):
+        raise ValueError("Proxy bid must be attached to a session")
+    proxy_bid.active = False
@@ -0,0 +1,148 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update, or_, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from db_management.models import SettlementJob, LeaderLease
+from utils.constants import SettlementJobStatus
+
+
+# one job per auction, enqueueing it again only moves a pending job or revives a finished one for a later end date
+def enqueue_settlement_job(session: Session, auction_id: int, run_at: datetime) -> None:
+    job = session.query(SettlementJob).where(SettlementJob.auction_id == auction_id).first()
+    if job is None:
+        try:
+            # in a savepoint, so a conflict leaves the rest of the transaction alone
+            with session.begin_nested():
+                session.add(SettlementJob(auction_id=auction_id, run_at=run_at))
+        except IntegrityError:
+            # enqueued by another node at the same time
+            pass
+        return
+
+    if job.status == SettlementJobStatus.PENDING:
+        job.run_at = run_at
+    elif job.status in (SettlementJobStatus.DONE, SettlementJobStatus.FAILED) and run_at > job.run_at:
+        job.status = SettlementJobStatus.PENDING
+        job.run_at = run_at
+        job.attempts = 0
+        job.last_error = None
+
+
+# bulk version for the catch-up after downtime, only the few auctions queued before go one by one
+def enqueue_settlement_jobs(session: Session, auction_ids: list[int], run_at: datetime) -> int:
+    queued = set(session.scalars(select(SettlementJob.auction_id).where(SettlementJob.auction_id.in_(auction_ids))))
+    for auction_id in queued:
+        enqueue_settlement_job(session, auction_id, run_at)
+
+    new_jobs = [SettlementJob(auction_id=auction_id, run_at=run_at) for auction_id in auction_ids
+                if auction_id not in queued]
+    try:
+        with session.begin_nested():
+            session.add_all(new_jobs)
+    except IntegrityError:
+        # another node is catching up at the same time, fall back to one by one
+        for auction_id in auction_ids:
+            enqueue_settlement_job(session, auction_id, run_at)
+    return len(new_jobs)
+
+
+def _claimable(now: datetime):
+    return or_(
+        and_(SettlementJob.status == SettlementJobStatus.PENDING, SettlementJob.run_at <= now),
+        # claimed by a node that died or hung while running it
+        and_(SettlementJob.status == SettlementJobStatus.RUNNING, SettlementJob.locked_until < now),
+    )
+
+
+# every job is claimed with a compare-and-swap update, a job is only returned to the node whose update won
+def claim_due_jobs(session: Session, worker_id: str, now: datetime, lease_seconds: float,
+                   limit: int) -> list[tuple[int, int]]:
+    candidates = session.execute(select(SettlementJob.id, SettlementJob.auction_id).where(
+        _claimable(now)
+    ).order_by(SettlementJob.run_at).limit(limit)).all()
+
+    claimed = []
+    for job_id, auction_id in candidates:
+        result = session.execute(update(SettlementJob).where(SettlementJob.id == job_id, _claimable(now)).values(
+            status=SettlementJobStatus.RUNNING,
+            locked_by=worker_id,
+            locked_until=now + timedelta(seconds=lease_seconds),
+            attempts=SettlementJob.attempts + 1,
+        ).execution_options(synchronize_session=False))
+        if result.rowcount == 1:
+            claimed.append((job_id, auction_id))
+    return claimed
+
+
+def complete_job(session: Session, job_id: int, worker_id: str) -> bool:
+    return _update_claimed_job(session, job_id, worker_id, status=SettlementJobStatus.DONE, locked_by=None,
+                               locked_until=None, last_error=None)
+
+
+# retry_at None means the job has run out of attempts
+def fail_job(session: Session, job_id: int, worker_id: str, error: str, retry_at: datetime | None) -> bool:
+    values = {"locked_by": None, "locked_until": None, "last_error": error[:1024]}
+    if retry_at is None:
+        values["status"] = SettlementJobStatus.FAILED
+    else:
+        values["status"] = SettlementJobStatus.PENDING
+        values["run_at"] = retry_at
+
+    return _update_claimed_job(session, job_id, worker_id, **values)
+
+
+# a node whose claim has expired and been taken over by another one can no longer change the job
+def _update_claimed_job(session: Session, job_id: int, worker_id: str, **values) -> bool:
+    result = session.execute(update(SettlementJob).where(
+        SettlementJob.id == job_id, SettlementJob.locked_by == worker_id
+    ).values(**values).execution_options(synchronize_session=False))
+    return result.rowcount == 1
+
+
+# a soft close has moved the end of the auction, written by the bid that has extended it
+def move_pending_job(session: Session, auction_id: int, run_at: datetime) -> bool:
+    result = session.execute(update(SettlementJob).where(
+        SettlementJob.auction_id == auction_id, SettlementJob.status == SettlementJobStatus.PENDING
+    ).values(run_at=run_at).execution_options(synchronize_session=False))
+    return result.rowcount == 1
+
+
+# the auction has been extended since the job was queued, it runs again at the new end date without using up an attempt
+def reschedule_job(session: Session, job_id: int, worker_id: str, run_at: datetime) -> bool:
+    return _update_claimed_job(session, job_id, worker_id, status=SettlementJobStatus.PENDING, run_at=run_at,
+                               locked_by=None, locked_until=None, attempts=SettlementJob.attempts - 1)
+
+
+def get_job_attempts(session: Session, job_id: int) -> int:
+    return session.scalar(select(SettlementJob.attempts).where(SettlementJob.id == job_id)) or 0
+
+
+# the lease is taken over only when it has expired, every other node keeps getting False until then
+def try_acquire_lease(session: Session, name: str, holder: str, now: datetime, ttl: float) -> bool:
+    expires_at = now + timedelta(seconds=ttl)
+    result = session.execute(update(LeaderLease).where(
+        LeaderLease.name == name, or_(LeaderLease.holder == holder, LeaderLease.expires_at < now)
+    ).values(holder=holder, expires_at=expires_at).execution_options(synchronize_session=False))
+    if result.rowcount == 1:
+        return True
+
+    if session.get(LeaderLease, name) is not None:
+        return False
+
+    session.add(LeaderLease(name=name, holder=holder, expires_at=expires_at))
+    try:
+        session.flush()
+    except IntegrityError:
+        # another node has created it first
+        session.rollback()
+        return False
+    return True
+
+
+# expires the lease right away, so another node can take over without waiting for the ttl
+def release_lease(session: Session, name: str, holder: str) -> None:
+    session.execute(update(LeaderLease).where(
+        LeaderLease.name == name, LeaderLease.holder == holder
+    ).values(expires_at=datetime.now()).execution_options(synchronize_session=False))
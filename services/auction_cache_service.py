@@ -0,0 +1,188 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import repos.async_auction_repo
+from db_management.models import Auction
+from services.metrics_service import get_metrics
+from utils.constants import AuctionType, AuctionStatus, AUCTION_CACHE_MAX_SIZE, AUCTION_CACHE_TTL
+
+
+# live part of an auction, everything a bid or a price view needs without touching the database
+class AuctionState:
+    def __init__(self, auction_id: int, auction_type: AuctionType, auction_status: AuctionStatus, seller_id: int,
+                 end_date: datetime, price: float, winner_id: int | None, bid_count: int):
+        self.auction_id = auction_id
+        self.auction_type = auction_type
+        self.auction_status = auction_status
+        self.seller_id = seller_id
+        self.end_date = end_date
+        self.price = price
+        self.winner_id = winner_id
+        self.bid_count = bid_count
+        self.loaded_at = time.monotonic()
+
+    @staticmethod
+    def from_auction(auction: Auction, bid_count: int) -> "AuctionState":
+        if auction.auction_type == AuctionType.BID:
+            price, winner_id = auction.bid.current_bid_value, auction.bid.current_bid_winner_id
+        else:
+            price, winner_id = auction.buy_now_price, auction.buyer_id
+
+        return AuctionState(auction.id, auction.auction_type, auction.auction_status, auction.seller_id,
+                            auction.end_date, price, winner_id, bid_count)
+
+    # same rules as Auction.is_auction_finished
+    @property
+    def is_finished(self) -> bool:
+        if self.end_date < datetime.now():
+            return True
+        if self.auction_status != AuctionStatus.ACTIVE:
+            return True
+        if self.auction_type == AuctionType.BUY_NOW:
+            return self.winner_id is not None
+        return False
+
+    # compact state sent to clients right after they follow the auction
+    def to_snapshot(self, seq: int) -> dict:
+        return {
+            "auction_id": self.auction_id,
+            "price": self.price,
+            "winner_id": self.winner_id,
+            "end_date": self.end_date.isoformat(),
+            "bid_count": self.bid_count,
+            "is_auction_finished": self.is_finished,
+            "seq": seq,
+        }
+
+    def __str__(self):
+        return f"AuctionState: [auction: {self.auction_id} price: {self.price} winner: {self.winner_id} " \
+               f"status: {self.auction_status} ends: {self.end_date}]"
+
+
+class _CacheEntry:
+    def __init__(self, state: AuctionState):
+        self.state = state
+        self.view: dict | None = None  # Auction.to_public() snapshot, dropped on every state change
+
+
+class AuctionCache:
+    def __init__(self, max_size: int = AUCTION_CACHE_MAX_SIZE, ttl: float = AUCTION_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: OrderedDict[int, _CacheEntry] = OrderedDict()
+        self.lock = threading.Lock()  # auctions are also settled from the scheduler thread
+
+    def _get_entry(self, auction_id: int) -> _CacheEntry | None:
+        entry = self.entries.get(auction_id)
+        if entry is None:
+            return None
+
+        # other workers update the database behind our back, so nothing is trusted for longer than ttl
+        if time.monotonic() - entry.state.loaded_at > self.ttl:
+            del self.entries[auction_id]
+            return None
+
+        self.entries.move_to_end(auction_id)
+        return entry
+
+    def get(self, auction_id: int) -> AuctionState | None:
+        with self.lock:
+            entry = self._get_entry(auction_id)
+        get_metrics().increment("auction_cache_hits" if entry else "auction_cache_misses")
+        return entry.state if entry else None
+
+    # public view with the time dependent fields brought up to date
+    def get_view(self, auction_id: int) -> dict | None:
+        with self.lock:
+            entry = self._get_entry(auction_id)
+            view = entry.view if entry else None
+        get_metrics().increment("auction_cache_hits" if view else "auction_cache_misses")
+        if view is None:
+            return None
+
+        is_finished = entry.state.is_finished
+        return {
+            **view,
+            "is_auction_finished": is_finished,
+            "days_left": 0 if is_finished else (entry.state.end_date - datetime.now()).days,
+        }
+
+    def put(self, state: AuctionState, view: dict | None = None) -> None:
+        with self.lock:
+            entry = _CacheEntry(state)
+            entry.view = view
+            self.entries[state.auction_id] = entry
+            self.entries.move_to_end(state.auction_id)
+
+            # least recently used auctions go first
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    # write-through update of an already cached auction, unknown auctions are loaded on the next read
+    def update(self, auction_id: int, **fields) -> None:
+        with self.lock:
+            entry = self.entries.get(auction_id)
+            if entry is None:
+                return
+
+            for name, value in fields.items():
+                setattr(entry.state, name, value)
+            entry.view = None
+
+    def record_bid(self, auction_id: int, price: float, winner_id: int, bids: int) -> None:
+        with self.lock:
+            entry = self.entries.get(auction_id)
+            if entry is None:
+                return
+
+            entry.state.price = price
+            entry.state.winner_id = winner_id
+            entry.state.bid_count += bids
+            entry.view = None
+
+    def invalidate(self, auction_id: int) -> None:
+        with self.lock:
+            self.entries.pop(auction_id, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def __contains__(self, auction_id: int) -> bool:
+        return auction_id in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+
+auction_cache_obj = None
+
+
+def get_auction_cache() -> AuctionCache:
+    global auction_cache_obj
+    if auction_cache_obj is None:
+        auction_cache_obj = AuctionCache()
+    return auction_cache_obj
+
+
+# snapshots never come from the cache: it may be behind the events other nodes have already sent,
+# the state and its seq are read together from the database, so the seq is always the one the state includes
+async def load_auction_snapshot(session: AsyncSession, auction_id: int) -> tuple[AuctionState, int] | None:
+    row = await repos.async_auction_repo.get_auction_snapshot(session, auction_id)
+    if row is None:
+        return None
+
+    if row.auction_type == AuctionType.BID:
+        price, winner_id = row.current_bid_value, row.current_bid_winner_id
+    else:
+        price, winner_id = row.buy_now_price, row.buyer_id
+    state = AuctionState(row.id, row.auction_type, row.auction_status, row.seller_id, row.end_date, price,
+                         winner_id, row.bid_count)
+
+    # fresher than anything cached, the next readers get it too
+    get_auction_cache().put(state)
+    return state, row.event_seq
@@ -0,0 +1,80 @@
+from collections import OrderedDict, deque
+
+from utils.constants import AUCTION_EVENT_BUFFER_SIZE, AUCTION_EVENT_LOG_MAX_AUCTIONS
+
+
+class _AuctionEvents:
+    def __init__(self, size: int):
+        self.events: deque[dict] = deque(maxlen=size)  # {"event": <name>, "data": <payload with seq>}, by seq
+
+    @property
+    def last_seq(self) -> int:
+        return self.events[-1]["data"]["seq"] if self.events else 0
+
+
+# keeps the latest events sent to every auction room, whichever socket server has sent them,
+# so a client that has missed some only needs the events after the last seq it has seen
+class AuctionEventLog:
+    def __init__(self, size: int = AUCTION_EVENT_BUFFER_SIZE, max_auctions: int = AUCTION_EVENT_LOG_MAX_AUCTIONS):
+        self.size = size
+        self.max_auctions = max_auctions
+        self.auctions: OrderedDict[int, _AuctionEvents] = OrderedDict()
+
+    # events of other servers may come in slightly out of order, each one is put in its place
+    def add(self, auction_id: int, event: str, data: dict) -> None:
+        auction_events = self.auctions.get(auction_id)
+        if auction_events is None:
+            auction_events = self.auctions[auction_id] = _AuctionEvents(self.size)
+            # auctions without events for the longest time go first
+            while len(self.auctions) > self.max_auctions:
+                self.auctions.popitem(last=False)
+        self.auctions.move_to_end(auction_id)
+
+        events, seq = auction_events.events, data["seq"]
+        position = len(events)
+        while position > 0 and events[position - 1]["data"]["seq"] >= seq:
+            if events[position - 1]["data"]["seq"] == seq:
+                return  # already known
+            position -= 1
+
+        if len(events) == events.maxlen:
+            if position == 0:
+                return  # older than everything kept
+            events.popleft()
+            position -= 1
+        events.insert(position, {"event": event, "data": data})
+
+    def last_seq(self, auction_id: int) -> int:
+        auction_events = self.auctions.get(auction_id)
+        return auction_events.last_seq if auction_events else 0
+
+    # None when the events after seq are not all kept here (too old, not received yet, or unknown after a restart)
+    def events_after(self, auction_id: int, seq: int) -> list[dict] | None:
+        auction_events = self.auctions.get(auction_id)
+        last_seq = auction_events.last_seq if auction_events else 0
+        if seq > last_seq:
+            return None
+        if seq == last_seq:
+            return []
+
+        events = [event for event in auction_events.events if event["data"]["seq"] > seq]
+        # a coalesced price update stands for the ones it has replaced
+        covered = {covered_seq for event in events
+                   for covered_seq in (event["data"]["seq"], *event["data"].get("replaced_seqs", ()))}
+        if not covered.issuperset(range(seq + 1, last_seq + 1)):
+            return None
+        return events
+
+    def __len__(self):
+        return len(self.auctions)
+
+
+auction_event_log_obj = None
+
+
+def get_auction_event_log() -> AuctionEventLog:
+    global auction_event_log_obj
+    if auction_event_log_obj is None:
+        auction_event_log_obj = AuctionEventLog()
+    return auction_event_log_obj
+
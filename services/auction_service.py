@@ -1,88 +1,298 @@
-import threading
+import time
+from datetime import datetime, timedelta
 
 from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 import db_management.dto
+import repos.async_auction_repo
+import repos.async_settlement_repo
+import repos.async_user_repo
 import repos.auction_repo
+import repos.settlement_repo
 import repos.stats_repo
 import repos.user_repo
 import services.email_service
 import tasks.auction_finished_task
-from db_management.models import Product, Auction, Bid
+from db_management.models import Product, Auction, Bid, User, ProxyBid
+from services.auction_cache_service import get_auction_cache, AuctionState
+from services.bid_sequencer_service import get_bid_sequencer
+from services.metrics_service import get_metrics
+from services.outbox_service import get_outbox
 from services.socketio_service import get_socket_manager, SocketManager
-from utils.constants import AuctionType, AuctionStatus, UserAccountType
+from utils.constants import AuctionType, AuctionStatus, UserAccountType, BID_PLACEMENT_MAX_ATTEMPTS, \
+    PROXY_BID_INCREMENT, SOFT_CLOSE_WINDOW, SOFT_CLOSE_EXTENSION
 from utils.constants import fastapi_logger as logger
 
 
-async def place_bid(session: Session, auction_id: int, user_id: int, amount: float) -> None:
-    user = repos.user_repo.get_by_id(session, user_id)
+async def place_bid(session: AsyncSession, auction_id: int, user_id: int, amount: float) -> None:
+    # round the amount to 2 decimal places
+    amount = round(amount, 2)
+
+    _reject_doomed_bid(auction_id, user_id)
+    with get_metrics().timer("place_bid.total"):
+        await _run_bid_attempts(session, auction_id, user_id, _try_place_bid, amount)
+
+
+async def place_proxy_bid(session: AsyncSession, auction_id: int, user_id: int, max_amount: float) -> None:
+    max_amount = round(max_amount, 2)
+
+    _reject_doomed_bid(auction_id, user_id)
+    with get_metrics().timer("place_proxy_bid.total"):
+        await _run_bid_attempts(session, auction_id, user_id, _try_place_proxy_bid, max_amount)
+
+
+# bids that are bound to fail are rejected from the cached auction state, without a database round-trip,
+# anything plausible (or not cached) goes on to the authoritative checks
+# only facts that cannot go stale are trusted: the cached winner may have been outbid and the cached end date
+# extended on another worker, a closed auction is never opened again
+def _reject_doomed_bid(auction_id: int, user_id: int) -> None:
+    state = get_auction_cache().get(auction_id)
+    if state is None:
+        return
+
+    if state.auction_type != AuctionType.BID:
+        reason, detail = "not_bid_auction", "This auction is not a bid auction"
+    elif state.auction_status != AuctionStatus.ACTIVE:
+        reason, detail = "finished", "This auction is not biddable / already finished"
+    elif state.seller_id == user_id:
+        reason, detail = "seller", "You cannot bid on your own auction"
+    else:
+        return
+
+    get_metrics().increment("bid_fast_rejections", label=reason)
+    raise HTTPException(status_code=400, detail=detail)
+
+
+async def _run_bid_attempts(session: AsyncSession, auction_id: int, user_id: int, attempt_fn, value: float) -> None:
+    # bids on the same auction are applied one by one, in the order they arrived
+    queued_at = time.perf_counter()
+    async with get_bid_sequencer().sequence(auction_id):
+        get_metrics().observe("bid.sequencer_wait", (time.perf_counter() - queued_at) * 1000)
+        for attempt in range(BID_PLACEMENT_MAX_ATTEMPTS):
+            if await attempt_fn(session, auction_id, user_id, value):
+                return
+
+            # bid was changed by another worker since we loaded it, start over with fresh data
+            await session.rollback()
+            get_metrics().increment("bid_cas_retries")
+            logger.trace(f"Bid on auction {auction_id} by user {user_id} conflicted, retrying (attempt {attempt + 1})")
+
+        get_metrics().increment("bid_cas_failures")
+        raise HTTPException(status_code=409, detail="Too many simultaneous bids on this auction, please try again")
+
+
+# load and validate everything a bid of any kind needs
+async def _get_biddable_auction(session: AsyncSession, auction_id: int, user_id: int) -> tuple[User, Auction]:
+    metrics = get_metrics()
+    with metrics.timer("bid.user_lookup"):
+        user = await repos.async_user_repo.get_by_id(session, user_id)
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
 
-    # round the amount to 2 decimal places
-    amount = round(amount, 2)
+    with metrics.timer("bid.auction_lookup"):
+        auction = await repos.async_auction_repo.get_auction_by_id(session, auction_id)
+    if auction is None:
+        raise HTTPException(status_code=404, detail="Auction not found")
 
-    # lock to prevent bidding simultaneously
-    with threading.Lock():
-        auction = repos.auction_repo.get_auction_by_id(session, auction_id)
-        if auction is None:
-            raise HTTPException(status_code=404, detail="Auction not found")
+    # keep the state of auctions people bid on at hand for the fast path
+    if auction_id not in get_auction_cache():
+        bid_count = await repos.async_auction_repo.get_total_bids(session, auction.bid_id) if auction.bid_id else 0
+        get_auction_cache().put(AuctionState.from_auction(auction, bid_count))
 
-        if auction.auction_type != AuctionType.BID:
-            raise HTTPException(status_code=400, detail="This auction is not a bid auction")
+    if auction.auction_type != AuctionType.BID:
+        raise HTTPException(status_code=400, detail="This auction is not a bid auction")
 
-        if auction.is_auction_finished:
-            raise HTTPException(status_code=400, detail="This auction is not biddable / already finished")
+    if auction.is_auction_finished:
+        raise HTTPException(status_code=400, detail="This auction is not biddable / already finished")
 
-        current_bid_winner = auction.bid.current_bid_winner
+    # Validate if user already has an active bid
+    # If so, check if user is trying to bid on the same auction
+    with metrics.timer("bid.participation_check"):
+        is_participating = await repos.async_auction_repo.is_user_participating_in_different_active_bid(
+            session, auction, user)
+    if is_participating:
+        raise HTTPException(status_code=400, detail="You can only bid on one auction at a time")
 
-        # Validate if user already has an active bid
-        # If so, check if user is trying to bid on the same auction
-        if repos.auction_repo.is_user_participating_in_different_active_bid(session, auction, user):
-            raise HTTPException(status_code=400, detail="You can only bid on one auction at a time")
+    if user.id == auction.seller_id:
+        raise HTTPException(status_code=400, detail="You cannot bid on your own auction")
 
-        # User should have at least the current bid value including the amount he wants to bid
-        new_bid_value = auction.bid.current_bid_value + amount
-        if user.balance_total < new_bid_value:
-            raise HTTPException(status_code=400,
-                                detail="Insufficient balance to place bid, it's required to have at least current bid value in your account + your bid value")
+    return user, auction
 
-        if user.id == auction.seller_id:
-            raise HTTPException(status_code=400, detail="You cannot bid on your own auction")
 
-        # check if there are any bids
-        if current_bid_winner:
-            if user.id == current_bid_winner.id:
-                raise HTTPException(status_code=400, detail="You are already the highest bidder")
+# returns False if the bid has been changed concurrently and the whole attempt should be retried
+async def _try_place_bid(session: AsyncSession, auction_id: int, user_id: int, amount: float) -> bool:
+    user, auction = await _get_biddable_auction(session, auction_id, user_id)
+    current_bid_winner = auction.bid.current_bid_winner
 
-            # check if winner has been changed
-            if current_bid_winner.id != user.id:
-                # send notification to the previous winner
-                await get_socket_manager().bid_winner_update_action(auction.bid.current_bid_winner_id)
+    # User should have at least the current bid value including the amount he wants to bid
+    new_bid_value = round(auction.bid.current_bid_value + amount, 2)
+    if user.balance_total < new_bid_value:
+        raise HTTPException(status_code=400,
+                            detail="Insufficient balance to place bid, it's required to have at least current bid value in your account + your bid value")
 
-        # real logic
-        repos.auction_repo.add_bid_participant(session, auction, user)
-        repos.auction_repo.create_bid_history_entry(session, auction, user, amount)
-        repos.auction_repo.update_bid_winner(auction, user, new_bid_value)
+    # check if there are any bids
+    if current_bid_winner and user.id == current_bid_winner.id:
+        raise HTTPException(status_code=400, detail="You are already the highest bidder")
 
-        # freeze the amount of new total bid price in the user's balance
-        repos.user_repo.set_frozen_balance(user, new_bid_value)
+    # proxy bidders answer the new bid right away, in memory
+    with get_metrics().timer("bid.proxy_resolution"):
+        proxy_bids = await repos.async_auction_repo.get_active_proxy_bids(session, auction.bid.id)
+        winner_id, price = _resolve_proxy_bids(new_bid_value, user.id, proxy_bids)
 
-        # send notification for all participants online
-        await SocketManager.bid_price_update_action(auction_id, new_bid_value)
+    history = [(user, amount)]
+    winner = user
+    if winner_id != user.id or price != new_bid_value:
+        winner = next(candidate.user for candidate in proxy_bids if candidate.user.id == winner_id)
+        history.append((winner, round(price - new_bid_value, 2)))
+
+    return await _save_bid_outcome(session, auction, user, current_bid_winner, winner, price, history, proxy_bids)
 
-        # save the transaction
-        session.commit()
 
+async def _try_place_proxy_bid(session: AsyncSession, auction_id: int, user_id: int, max_amount: float) -> bool:
+    user, auction = await _get_biddable_auction(session, auction_id, user_id)
+    current_bid_winner = auction.bid.current_bid_winner
+    current_bid_value = auction.bid.current_bid_value
+
+    if user.balance_total < max_amount:
+        raise HTTPException(status_code=400, detail="Insufficient balance to cover the maximum bid")
 
-def buy_now(session: Session, auction_id: int, user_id: int, send_email: bool = True) -> None:
-    user = repos.user_repo.get_by_id(session, user_id)
+    is_winning = current_bid_winner is not None and user.id == current_bid_winner.id
+    if max_amount < current_bid_value + (0 if is_winning else PROXY_BID_INCREMENT):
+        raise HTTPException(status_code=400,
+                            detail=f"Maximum bid must be at least current bid value + {PROXY_BID_INCREMENT}")
+
+    proxy_bids = await repos.async_auction_repo.get_active_proxy_bids(session, auction.bid.id)
+    proxy_bid = await repos.async_auction_repo.set_proxy_bid(session, auction, user, max_amount)
+
+    # already winning, the new maximum is used once someone outbids the user
+    if is_winning:
+        await session.commit()
+        return True
+
+    if proxy_bid not in proxy_bids:
+        proxy_bids.append(proxy_bid)
+
+    winner_id, price = _resolve_proxy_bids(current_bid_value,
+                                           current_bid_winner.id if current_bid_winner else None, proxy_bids)
+    winner = next(candidate.user for candidate in proxy_bids if candidate.user.id == winner_id)
+    history = [(winner, round(price - current_bid_value, 2))]
+
+    return await _save_bid_outcome(session, auction, user, current_bid_winner, winner, price, history, proxy_bids)
+
+
+# one round of proxy bidding against the current winner, returns the new (winner id, price)
+def _resolve_proxy_bids(price: float, winner_id: int | None, proxy_bids: list[ProxyBid]) -> tuple[int | None, float]:
+    # nobody is raised above what they can actually pay
+    limits = {proxy_bid.user.id: min(proxy_bid.max_amount, proxy_bid.user.balance_total) for proxy_bid in proxy_bids}
+    defender_limit = max(limits.pop(winner_id, price), price)
+    if not limits:
+        return winner_id, price
+
+    # highest limit challenges the winner, max() keeps the oldest proxy bid on a tie
+    challenger_id = max(limits, key=limits.get)
+    challenger_limit = limits.pop(challenger_id)
+    if challenger_limit < price + PROXY_BID_INCREMENT:
+        return winner_id, price
+
+    if challenger_limit > defender_limit:
+        runner_up_limit = max([defender_limit, *limits.values()])
+        return challenger_id, round(min(challenger_limit, runner_up_limit + PROXY_BID_INCREMENT), 2)
+
+    # current winner keeps the lead, raised just above the challenger
+    return winner_id, round(min(defender_limit, challenger_limit + PROXY_BID_INCREMENT), 2)
+
+
+async def _save_bid_outcome(session: AsyncSession, auction: Auction, bidder: User, previous_winner: User | None,
+                            winner: User, price: float, history: list[tuple[User, float]],
+                            proxy_bids: list[ProxyBid]) -> bool:
+    metrics = get_metrics()
+
+    # real logic, the winner is swapped first so nothing else is written if we lost the race
+    with metrics.timer("bid.winner_update"):
+        is_updated = await repos.async_auction_repo.update_bid_winner(session, auction, winner, price)
+    if not is_updated:
+        return False
+
+    # seqs of the room events announcing this bid, the auction row is locked before the users like settlement does
+    extended_end_date = _get_soft_close_end_date(auction)
+    seq = await repos.async_auction_repo.increment_event_seq(session, auction.id,
+                                                             1 if extended_end_date is None else 2)
+
+    participants = {bidder.id: bidder}
+    for user, amount in history:
+        participants[user.id] = user
+        repos.async_auction_repo.create_bid_history_entry(session, auction, user, amount)
+
+    with metrics.timer("bid.participants_update"):
+        for user in participants.values():
+            await repos.async_auction_repo.add_bid_participant(session, auction, user)
+
+    # proxy bids that can no longer beat the price are done
+    for proxy_bid in proxy_bids:
+        if proxy_bid.user.id != winner.id and proxy_bid.max_amount < price + PROXY_BID_INCREMENT:
+            repos.auction_repo.deactivate_proxy_bid(proxy_bid)
+
+    # freeze the amount of new total bid price in the user's balance
+    repos.user_repo.set_frozen_balance(winner, price)
+
+    # soft close, a bid in the final seconds gives the other bidders time to answer
+    if extended_end_date is not None:
+        repos.auction_repo.set_auction_end_date(auction, extended_end_date)
+        # the settlement job moves with the end, a job already running finds the auction extended and reschedules
+        await repos.async_settlement_repo.move_pending_job(session, auction.id, extended_end_date)
+        get_outbox().stage(session, SocketManager.auction_extended_action, auction.id, extended_end_date, seq - 1)
+
+    # winner has been changed, notify everyone who has lost the lead (sent by the outbox once committed)
+    outbid_user_ids = {user.id for user in (previous_winner, bidder) if user is not None and user.id != winner.id}
+    for user_id in outbid_user_ids:
+        get_outbox().stage(session, SocketManager.bid_winner_update_action, user_id)
+
+    # send notification for all participants online
+    get_outbox().stage(session, SocketManager.bid_price_update_action, auction.id, price, seq)
+
+    # save the transaction
+    with metrics.timer("bid.commit"):
+        await session.commit()
+
+    # write-through, only once the new state is actually stored
+    get_auction_cache().record_bid(auction.id, price, winner.id, len(history))
+    if extended_end_date is not None:
+        get_auction_cache().update(auction.id, end_date=extended_end_date)
+        tasks.auction_finished_task.get_expiry_tracker().track(auction.id, extended_end_date)
+    return True
+
+
+def _get_soft_close_end_date(auction: Auction) -> datetime | None:
+    if SOFT_CLOSE_WINDOW <= 0:
+        return None
+
+    now = datetime.now()
+    if (auction.end_date - now).total_seconds() > SOFT_CLOSE_WINDOW:
+        return None
+
+    end_date = now + timedelta(seconds=SOFT_CLOSE_EXTENSION)
+    return end_date if end_date > auction.end_date else None
+
+
+async def buy_now(session: AsyncSession, auction_id: int, user_id: int, send_email: bool = True) -> None:
+    with get_metrics().timer("buy_now.total"):
+        await _buy_now(session, auction_id, user_id, send_email)
+
+
+async def _buy_now(session: AsyncSession, auction_id: int, user_id: int, send_email: bool) -> None:
+    metrics = get_metrics()
+    with metrics.timer("buy_now.user_lookup"):
+        user = await repos.async_user_repo.get_by_id(session, user_id)
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
 
-    with threading.Lock():  # lock to prevent buying simultaneously
-        auction = repos.auction_repo.get_full_auction_by_id(session, auction_id)
+    queued_at = time.perf_counter()
+    async with get_bid_sequencer().sequence(auction_id):  # prevent buying simultaneously
+        metrics.observe("buy_now.sequencer_wait", (time.perf_counter() - queued_at) * 1000)
+        with metrics.timer("buy_now.auction_lookup"):
+            auction = await repos.async_auction_repo.get_full_auction_by_id(session, auction_id)
         if auction is None:
             raise HTTPException(status_code=404, detail="Auction not found")
 
@@ -101,9 +311,12 @@ def buy_now(session: Session, auction_id: int, user_id: int, send_email: bool =
         # real logic
         repos.auction_repo.add_user_auction_buyer(auction, user)
         repos.auction_repo.set_auction_status(auction, AuctionStatus.INACTIVE)
+        seq = await repos.async_auction_repo.increment_event_seq(session, auction.id)
 
         # deduct the amount from the user's balance
         repos.user_repo.deduct_total_balance(user, auction.buy_now_price)
+        get_outbox().stage(session, get_socket_manager().auction_ended_action, auction.id, auction.buy_now_price,
+                           user.id, seq)
 
         # send email to the buyer and seller
         # if send_email:
@@ -112,7 +325,26 @@ def buy_now(session: Session, auction_id: int, user_id: int, send_email: bool =
         # services.email_service.send_seller_auction_completed_email(auction.seller.email, user, auction)
 
         # save the transaction
-        session.commit()
+        with metrics.timer("buy_now.commit"):
+            await session.commit()
+
+        get_auction_cache().update(auction.id, auction_status=AuctionStatus.INACTIVE, winner_id=user.id)
+        tasks.auction_finished_task.get_expiry_tracker().untrack(auction.id)
+
+
+def get_auction(session: Session, auction_id: int) -> dict:
+    view = get_auction_cache().get_view(auction_id)
+    if view is not None:
+        return view
+
+    auction = repos.auction_repo.get_full_auction_by_id(session, auction_id)
+    if auction is None:
+        raise HTTPException(status_code=404, detail="Auction not found")
+
+    bid_count = repos.stats_repo.get_auction_total_bids(session, auction.bid_id) if auction.bid_id else 0
+    view = auction.to_public()
+    get_auction_cache().put(AuctionState.from_auction(auction, bid_count), view)
+    return view
 
 
 def create_auction(session: Session, auction: db_management.dto.CreateAuction, user_id: int) -> None:
@@ -151,30 +383,73 @@ def create_auction(session: Session, auction: db_management.dto.CreateAuction, u
 
     # real logic
     repos.auction_repo.create_auction(session, db_auction)
+    session.flush()
 
-    # reload tracked auctions
-    tasks.auction_finished_task.reload_tracked_auctions()
+    # stored with the auction, so it is settled at its end date whichever node is running then
+    repos.settlement_repo.enqueue_settlement_job(session, db_auction.id, db_auction.end_date)
 
     # save the transaction
     session.commit()
 
+    # only a hint, the settlement leader is woken up at the end date instead of at its next poll
+    tasks.auction_finished_task.get_expiry_tracker().track(db_auction.id, db_auction.end_date)
+
 
-def bid_finished(session: Session, auction_id: int) -> None:
+# settlement job of an auction, returns the new end date of an auction that has been extended since it was queued,
+# None once it is settled
+def auction_finished(session: Session, auction_id: int) -> datetime | None:
     auction = repos.auction_repo.get_full_auction_by_id(session, auction_id)
     if auction is None:
         raise ValueError("Auction not found")
 
-    if auction.auction_type != AuctionType.BID:
-        raise ValueError("This auction is not a bid auction")
+    if auction.auction_type == AuctionType.BUY_NOW:
+        return _buy_now_finished(session, auction)
+    return _bid_finished(session, auction)
 
+
+# nobody has bought it, there is nothing to settle, it is only closed
+def _buy_now_finished(session: Session, auction: Auction) -> datetime | None:
     if auction.auction_status == AuctionStatus.INACTIVE:
-        raise ValueError("This auction is not active")
+        logger.info(f"Auction {auction.id} has already been bought or closed")
+        return None
+
+    if auction.end_date > datetime.now():
+        logger.info(f"Auction {auction.id} has not ended yet, it ends at {auction.end_date}")
+        return auction.end_date
+
+    # a buy racing with the end wins or loses on the status, the auction is announced as ended only when closed here
+    closed = repos.auction_repo.close_auctions(session, [auction.id])
+    for auction_id, seq in closed.items():
+        get_outbox().stage(session, get_socket_manager().auction_ended_action, auction_id, None, None, seq)
+    session.commit()
+
+    if closed:
+        logger.info(f"Auction {auction.id} has ended unsold")
+        get_auction_cache().update(auction.id, auction_status=AuctionStatus.INACTIVE)
+    return None
+
+
+def _bid_finished(session: Session, auction: Auction) -> datetime | None:
+    auction_id = auction.id
+
+    # settlement jobs may run more than once, an auction that is already settled is left as it is
+    if auction.auction_status == AuctionStatus.INACTIVE:
+        logger.info(f"Auction {auction_id} has already been settled")
+        return None
+
+    if auction.end_date > datetime.now():
+        logger.info(f"Auction {auction_id} has not ended yet, it ends at {auction.end_date}")
+        return auction.end_date
 
     if auction.bid.current_bid_winner is None:
         logger.info(f"Auction {auction_id} has ended without any bids")
         repos.auction_repo.set_auction_status(auction, AuctionStatus.INACTIVE)
+        seq = repos.auction_repo.increment_event_seq(session, auction_id)
+        get_outbox().stage(session, get_socket_manager().auction_ended_action, auction_id,
+                           auction.bid.current_bid_value, None, seq)
         session.commit()
-        return
+        get_auction_cache().update(auction_id, auction_status=AuctionStatus.INACTIVE)
+        return None
 
     buyer = auction.bid.current_bid_winner
 
@@ -184,16 +459,31 @@ def bid_finished(session: Session, auction_id: int) -> None:
 
     # set up auction as finished
     repos.auction_repo.set_auction_status(auction, AuctionStatus.INACTIVE)
+    seq = repos.auction_repo.increment_event_seq(session, auction_id)
 
     # deduct the amount from the user's balance
     repos.user_repo.deduct_total_balance(buyer, auction.bid.current_bid_value)
-
-    # send email to the buyer and seller
-    services.email_service.send_user_won_auction_email(buyer, auction)
-    services.email_service.send_seller_auction_completed_email(auction.seller.email, buyer, auction)
+    get_outbox().stage(session, get_socket_manager().auction_ended_action, auction_id,
+                       auction.bid.current_bid_value, buyer.id, seq)
 
     # save the transaction
     session.commit()
+    get_auction_cache().update(auction_id, auction_status=AuctionStatus.INACTIVE)
+
+    # send email to the buyer and seller, only once the auction is settled and without holding the transaction open
+    # a failing email must not fail the settlement, its retry would find the auction settled and send nothing
+    _send_settlement_email(services.email_service.send_user_won_auction_email, buyer, auction)
+    _send_settlement_email(services.email_service.send_seller_auction_completed_email, auction.seller.email, buyer,
+                           auction)
+    return None
+
+
+def _send_settlement_email(send, *args) -> None:
+    try:
+        send(*args)
+    except Exception as e:
+        get_metrics().increment("settlement_emails_failed")
+        logger.error(f"Failed to send {send.__name__}: {e}")
 
 
 def auction_stats(session: Session, auction_id: int) -> dict:
@@ -0,0 +1,52 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from utils.constants import fastapi_logger as logger
+
+
+# per-auction lock entry, counts everyone holding or waiting for the lock
+class _AuctionSlot:
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class BidSequencer:
+    def __init__(self):
+        self.slots: dict[int, _AuctionSlot] = {}
+
+    @asynccontextmanager
+    async def sequence(self, auction_id: int):
+        # asyncio.Lock wakes up waiters in FIFO order, so bids on the same auction
+        # are applied in the order they arrived, while other auctions are not affected
+        slot = self.slots.get(auction_id)
+        if slot is None:
+            slot = _AuctionSlot()
+            self.slots[auction_id] = slot
+
+        slot.users += 1
+        try:
+            async with slot.lock:
+                yield
+        finally:
+            slot.users -= 1
+            # evict idle auctions so the dict does not grow with every auction ever bid on
+            if slot.users == 0 and self.slots.get(auction_id) is slot:
+                del self.slots[auction_id]
+                logger.trace(f"Bid sequencer for auction {auction_id} evicted")
+
+    def is_idle(self, auction_id: int) -> bool:
+        return auction_id not in self.slots
+
+    def __len__(self):
+        return len(self.slots)
+
+
+bid_sequencer_obj = None
+
+
+def get_bid_sequencer() -> BidSequencer:
+    global bid_sequencer_obj
+    if bid_sequencer_obj is None:
+        bid_sequencer_obj = BidSequencer()
+    return bid_sequencer_obj
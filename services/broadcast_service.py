@@ -0,0 +1,104 @@
+import asyncio
+import pickle
+
+import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+from services.auction_event_service import AuctionEventLog, get_auction_event_log
+from utils.constants import socketio_logger as logger
+
+
+# stand-in for redis when every socket server runs in the same process (tests, local development)
+class InMemoryBroker:
+    def __init__(self):
+        self.subscribers: dict[str, list[asyncio.Queue]] = {}
+
+    def subscribe(self, channel: str) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        self.subscribers.setdefault(channel, []).append(queue)
+        return queue
+
+    def unsubscribe(self, channel: str, queue: asyncio.Queue) -> None:
+        queues = self.subscribers.get(channel, [])
+        if queue in queues:
+            queues.remove(queue)
+
+    def publish(self, channel: str, message: bytes) -> None:
+        for queue in self.subscribers.get(channel, []):
+            queue.put_nowait(message)
+
+
+memory_broker_obj = None
+
+
+def get_memory_broker() -> InMemoryBroker:
+    global memory_broker_obj
+    if memory_broker_obj is None:
+        memory_broker_obj = InMemoryBroker()
+    return memory_broker_obj
+
+
+# mixed into every pub/sub manager: auction events sent by the other socket servers go into the local log too,
+# so a resync can be answered by whichever server the client is connected to
+class AuctionEventRecorder:
+    event_log: AuctionEventLog | None = None
+
+    async def _handle_emit(self, message):
+        room, data = message.get('room'), message.get('data')
+        if message.get('host_id') != self.host_id and isinstance(room, int) and isinstance(data, dict) \
+                and "seq" in data:
+            event_log = self.event_log if self.event_log is not None else get_auction_event_log()
+            event = message.get('event')
+            event_log.add(room, getattr(event, "value", event), data)
+        await super()._handle_emit(message)
+
+
+class RedisManager(AuctionEventRecorder, socketio.AsyncRedisManager):
+    pass
+
+
+class AioPikaManager(AuctionEventRecorder, socketio.AsyncAioPikaManager):
+    pass
+
+
+# socket.io client manager fanning emits and room changes out through an InMemoryBroker
+class InMemoryManager(AuctionEventRecorder, AsyncPubSubManager):
+    name = 'memory'
+
+    def __init__(self, broker: InMemoryBroker | None = None, channel='socketio', write_only=False,
+                 event_log: AuctionEventLog | None = None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.broker = broker or get_memory_broker()
+        self.event_log = event_log
+
+    async def _publish(self, data):
+        # serialized like on a real transport, so servers never share the message objects
+        self.broker.publish(self.channel, pickle.dumps(data))
+
+    async def _listen(self):
+        queue = self.broker.subscribe(self.channel)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self.broker.unsubscribe(self.channel, queue)
+
+
+# every socket server sharing the same message queue reaches the clients connected to the other ones,
+# no url keeps the default in-process manager
+def create_client_manager(url: str) -> socketio.AsyncManager | None:
+    if not url:
+        return None
+
+    if url.startswith("memory://"):
+        return InMemoryManager()
+
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        # needs the optional redis package
+        return RedisManager(url, logger=logger)
+
+    if url.startswith(("amqp://", "amqps://")):
+        # needs the optional aio_pika package
+        return AioPikaManager(url, logger=logger)
+
+    raise ValueError(f"Unsupported socket.io message queue: {url}")
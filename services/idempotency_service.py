@@ -0,0 +1,91 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+from fastapi import HTTPException
+
+from services.metrics_service import get_metrics
+from utils.constants import IDEMPOTENCY_KEY_MAX_LENGTH, IDEMPOTENCY_STORE_MAX_SIZE, IDEMPOTENCY_KEY_TTL
+
+
+class _IdempotencyEntry:
+    def __init__(self, fingerprint: str, expires_at: float):
+        self.fingerprint = fingerprint
+        self.expires_at = expires_at
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+# results of requests sent with an Idempotency-Key header, a retried request gets the stored result
+# instead of running the whole transaction again
+class IdempotencyStore:
+    def __init__(self, max_size: int = IDEMPOTENCY_STORE_MAX_SIZE, ttl: float = IDEMPOTENCY_KEY_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: OrderedDict[tuple, _IdempotencyEntry] = OrderedDict()
+
+    async def execute(self, key: str | None, user_id: int, endpoint: str, payload: dict,
+                      action: Callable[[], Awaitable[Any]]) -> Any:
+        if key is None:
+            return await action()
+
+        if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            raise HTTPException(status_code=400, detail="Invalid Idempotency-Key header")
+
+        self._evict_expired()
+
+        # keys are scoped to the user and the endpoint, nobody can replay someone else's response
+        entry_key = (user_id, endpoint, key)
+        fingerprint = json.dumps(payload, sort_keys=True, default=str)
+        entry = self.entries.get(entry_key)
+        if entry is not None:
+            if entry.fingerprint != fingerprint:
+                raise HTTPException(status_code=422, detail="Idempotency-Key has already been used with another request")
+
+            # finished requests return right away, the ones still running are awaited
+            get_metrics().increment("idempotent_replays", label=endpoint)
+            return await asyncio.shield(entry.future)
+
+        entry = _IdempotencyEntry(fingerprint, time.monotonic() + self.ttl)
+        self.entries[entry_key] = entry
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+        try:
+            result = await action()
+        except BaseException as e:
+            # nothing has been stored by a failed request, a retry should run it again
+            if self.entries.get(entry_key) is entry:
+                del self.entries[entry_key]
+            if isinstance(e, Exception):
+                entry.future.set_exception(e)
+                entry.future.exception()  # mark as retrieved, there may be nobody waiting for it
+            else:
+                entry.future.cancel()
+            raise
+
+        entry.future.set_result(result)
+        return result
+
+    # entries share the same ttl, so the oldest ones are always at the front
+    def _evict_expired(self) -> None:
+        now = time.monotonic()
+        while self.entries:
+            entry_key, entry = next(iter(self.entries.items()))
+            if entry.expires_at > now:
+                break
+            del self.entries[entry_key]
+
+    def __len__(self):
+        return len(self.entries)
+
+
+idempotency_store_obj = None
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    global idempotency_store_obj
+    if idempotency_store_obj is None:
+        idempotency_store_obj = IdempotencyStore()
+    return idempotency_store_obj
@@ -0,0 +1,140 @@
+import bisect
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+
+TIMINGS_ENABLED = os.getenv("METRICS_TIMINGS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# upper bounds of the latency buckets in milliseconds, anything slower lands in the last open bucket
+LATENCY_BUCKETS_MS = [0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+
+# fixed bucket histogram, constant memory and O(log n) per sample no matter how many samples are recorded
+class Histogram:
+    def __init__(self, bounds: list[float] = LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    # upper bound of the bucket holding the given quantile, samples above the last bound report the max
+    def percentile(self, quantile: float) -> float:
+        if self.count == 0:
+            return 0.0
+
+        rank = quantile * self.count
+        seen = 0
+        for bound, bucket in zip(self.bounds, self.buckets):
+            seen += bucket
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max, 3),
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+        }
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics: "Metrics", name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.observe(self.name, (time.perf_counter() - self.start) * 1000)
+        return False
+
+
+# shared no-op returned while timings are disabled, so a disabled timer costs one attribute check
+_disabled_timer = nullcontext()
+
+
+class Metrics:
+    def __init__(self, timings_enabled: bool = TIMINGS_ENABLED):
+        self.timings_enabled = timings_enabled
+        self.counters: dict[str, int] = defaultdict(int)
+        self.labeled_counters: dict[str, dict] = defaultdict(lambda: defaultdict(int))
+        self.histograms: dict[str, Histogram] = defaultdict(Histogram)
+        self.gauges: dict[str, float] = {}
+        self.lock = threading.Lock()  # also written by the settlement, tracker and catch-up threads
+
+    # labels come from a small fixed set (reasons, endpoints), never ids, every label is kept for good
+    def increment(self, name: str, amount: int = 1, label=None) -> None:
+        with self.lock:
+            self.counters[name] += amount
+            if label is not None:
+                self.labeled_counters[name][label] += amount
+
+    def set_gauge(self, name: str, value: float) -> None:
+        with self.lock:
+            self.gauges[name] = value
+
+    def get_gauge(self, name: str) -> float | None:
+        return self.gauges.get(name)
+
+    def get_counter(self, name: str, label=None) -> int:
+        if label is None:
+            return self.counters.get(name, 0)
+        return self.labeled_counters.get(name, {}).get(label, 0)
+
+    # usage: with get_metrics().timer("bid.commit"): ...
+    def timer(self, name: str):
+        if not self.timings_enabled:
+            return _disabled_timer
+        return _Timer(self, name)
+
+    def observe(self, name: str, value_ms: float) -> None:
+        if self.timings_enabled:
+            with self.lock:
+                self.histograms[name].observe(value_ms)
+
+    def get_histogram(self, name: str) -> Histogram | None:
+        return self.histograms.get(name)
+
+    def reset(self) -> None:
+        with self.lock:
+            self.counters.clear()
+            self.labeled_counters.clear()
+            self.histograms.clear()
+            self.gauges.clear()
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "counters": dict(self.counters),
+                "labeled_counters": {name: dict(values) for name, values in self.labeled_counters.items()},
+                "gauges": dict(self.gauges),
+                "timings": {name: histogram.snapshot() for name, histogram in sorted(self.histograms.items())},
+            }
+
+
+metrics_obj = None
+
+
+def get_metrics() -> Metrics:
+    global metrics_obj
+    if metrics_obj is None:
+        metrics_obj = Metrics()
+    return metrics_obj
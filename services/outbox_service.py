@@ -0,0 +1,119 @@
+import asyncio
+import contextlib
+from typing import Awaitable, Callable
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from services.metrics_service import get_metrics
+from utils.constants import fastapi_logger as logger
+
+OUTBOX_SESSION_KEY = "notification_outbox"
+
+
+# notifications staged during a transaction, sent by a background task only once the transaction has committed
+class NotificationOutbox:
+    def __init__(self):
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.queue: asyncio.Queue | None = None
+        self.dispatcher_task: asyncio.Task | None = None
+
+    # session can be a Session or an AsyncSession, both share the same info dict
+    def stage(self, session, action: Callable[..., Awaitable], *args) -> None:
+        session.info.setdefault(OUTBOX_SESSION_KEY, []).append((action, args))
+
+    def on_commit(self, session: Session) -> None:
+        staged = session.info.pop(OUTBOX_SESSION_KEY, None)
+        if staged:
+            self.publish(staged)
+
+    @staticmethod
+    def on_rollback(session: Session) -> None:
+        staged = session.info.pop(OUTBOX_SESSION_KEY, None)
+        if staged:
+            logger.trace(f"Dropped {len(staged)} notifications of a rolled back transaction")
+
+    def start(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self.dispatcher_task = self.loop.create_task(self._dispatch())
+        logger.trace("Notification outbox dispatcher started")
+
+    # waits for the dispatcher to be cancelled, so no task is left pending when its loop is closed
+    async def stop(self) -> None:
+        task, queue = self.dispatcher_task, self.queue
+        self.loop = self.queue = self.dispatcher_task = None
+        if task is None or task.done() or task.get_loop().is_closed():
+            return
+
+        if queue.qsize():
+            logger.warning(f"Dropped {queue.qsize()} notifications, outbox dispatcher is stopping")
+        task.cancel()
+        # the dispatcher of another loop can only be cancelled, it ends once that loop runs again
+        if task.get_loop() is asyncio.get_running_loop():
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        logger.trace("Notification outbox dispatcher stopped")
+
+    def publish(self, actions: list[tuple[Callable[..., Awaitable], tuple]]) -> None:
+        if not self._ensure_started():
+            logger.warning(f"Dropped {len(actions)} notifications, outbox dispatcher is not running")
+            return
+
+        if self._is_loop_thread():
+            self._put_all(actions)
+        else:
+            # committed from a worker thread (e.g. a background task), hand over to the event loop in one call
+            self.loop.call_soon_threadsafe(self._put_all, actions)
+
+    def _put_all(self, actions: list[tuple[Callable[..., Awaitable], tuple]]) -> None:
+        for action in actions:
+            self.queue.put_nowait(action)
+
+    def _is_loop_thread(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def _ensure_started(self) -> bool:
+        if self.loop is not None and not self.loop.is_closed() and self.loop.is_running():
+            return True
+
+        # started lazily on the running loop when there was no startup hook (e.g. tests)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        self.start()
+        return True
+
+    async def _dispatch(self) -> None:
+        while True:
+            action, args = await self.queue.get()
+            try:
+                # socket emits are timed here, they no longer run inside the request
+                with get_metrics().timer(f"outbox.{getattr(action, '__name__', 'action')}"):
+                    await action(*args)
+            except Exception as e:
+                logger.error(f"Failed to dispatch notification {getattr(action, '__name__', action)}: {e}")
+
+
+outbox_obj = None
+
+
+def get_outbox() -> NotificationOutbox:
+    global outbox_obj
+    if outbox_obj is None:
+        outbox_obj = NotificationOutbox()
+    return outbox_obj
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session: Session) -> None:
+    get_outbox().on_commit(session)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _after_rollback(session: Session, previous_transaction) -> None:
+    NotificationOutbox.on_rollback(session)
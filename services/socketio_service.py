@@ -1,15 +1,31 @@
+import asyncio
+from datetime import datetime
+from typing import Awaitable, Callable
+
 import socketio
 from aiohttp import web
 from jose import jwt
 
+from db_management.database import async_session_maker
 from response_models.auth_responses import SECRET_KEY, ALGORITHM
-from utils.constants import socketio_logger as logger, WebSocketAction
-
-sio = socketio.AsyncServer(cors_allowed_origins="*")
+from services.auction_cache_service import load_auction_snapshot
+from services.auction_event_service import get_auction_event_log
+from services.broadcast_service import create_client_manager
+from services.metrics_service import get_metrics
+from utils.constants import socketio_logger as logger, WebSocketAction, SOCKETIO_MESSAGE_QUEUE, \
+    BID_PRICE_UPDATES_PER_SECOND
+
+# with a message queue, emits reach the clients of every socket server, not only the ones connected to this process
+sio = socketio.AsyncServer(cors_allowed_origins="*", client_manager=create_client_manager(SOCKETIO_MESSAGE_QUEUE))
 app = web.Application()
 sio.attach(app)
 
 
+# every connection of a user joins the room of the user, whichever socket server it is connected to
+def user_room(user_id) -> str:
+    return f"user:{user_id}"
+
+
 # store sid - jwt mapping
 class SocketUser:
     def __init__(self, sid):
@@ -33,6 +49,10 @@ class SocketUser:
         await sio.emit('msg', room=self.sid, data=message)
 
     async def follow_auction(self, auction_id):
+        # rooms of ended auctions may have been closed by another socket server
+        rooms = sio.rooms(self.sid)
+        self.followed_auctions = [followed for followed in self.followed_auctions if followed in rooms]
+
         if auction_id in self.followed_auctions:
             logger.trace(f"{self} already following auction {auction_id}")
             await self.send_message(f"You are already following auction {auction_id}")
@@ -43,16 +63,110 @@ class SocketUser:
             await self.send_message("You can only follow up to 5 auctions")
             return
 
-        self.followed_auctions.append(auction_id)
+        # joined before the snapshot is read, so every event after its seq reaches the client through the room
         await sio.enter_room(self.sid, auction_id)
 
-        await self.send_message(f"Following auction {auction_id}")
+        async with async_session_maker() as session:
+            snapshot = await load_auction_snapshot(session, auction_id)
+        if snapshot is None:
+            await sio.leave_room(self.sid, auction_id)
+            await self.send_message(f"Auction {auction_id} not found")
+            return
+        state, seq = snapshot
+
+        # an ended auction's room has already been closed, the snapshot is all there is to know
+        if state.is_finished:
+            await sio.leave_room(self.sid, auction_id)
+        else:
+            self.followed_auctions.append(auction_id)
+            await self.send_message(f"Following auction {auction_id}")
+
+        # updates sent after seq may arrive before the snapshot, seq orders them
+        await sio.emit(WebSocketAction.AUCTION_SNAPSHOT, data=state.to_snapshot(seq), room=self.sid)
         logger.trace(f"{self} following auction {auction_id}")
 
+    def forget_auction(self, auction_id):
+        if auction_id in self.followed_auctions:
+            self.followed_auctions.remove(auction_id)
+
     def __str__(self):
         return f"SocketUser(sid={self.sid}, user_id={self.user_id}, username={self.username})"
 
 
+# at most max_rate price updates per second and auction: the first one of a quiet auction is sent right away,
+# the ones coming in faster are coalesced and only the latest price is sent once the interval has passed,
+# along with the seqs of the updates it has replaced
+class PriceUpdateThrottle:
+    def __init__(self, send: Callable[[int, float, int, list[int]], Awaitable],
+                 max_rate: float = BID_PRICE_UPDATES_PER_SECOND):
+        self.send = send
+        self.interval = 1 / max_rate if max_rate else 0
+        # <auction_id>: (<latest price not sent yet>, <its seq>, <seqs of the updates it replaces>)
+        self.pending: dict[int, tuple[float, int, list[int]]] = {}
+        self.timers: dict[int, asyncio.TimerHandle] = {}  # auctions within the interval after their last update
+        self.tasks: set[asyncio.Task] = set()
+        self.loop: asyncio.AbstractEventLoop | None = None
+
+    async def update(self, auction_id: int, price: float, seq: int) -> None:
+        if not self.interval:
+            await self.send(auction_id, price, seq, [])
+            return
+
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            # timers of a previous loop (e.g. tests) would never fire
+            self.loop = loop
+            self.timers.clear()
+            self.pending.clear()
+
+        if auction_id in self.timers:
+            replaced_seqs = []
+            if auction_id in self.pending:
+                get_metrics().increment("bid_price_updates_coalesced")
+                _, pending_seq, replaced_seqs = self.pending[auction_id]
+                replaced_seqs = [*replaced_seqs, pending_seq]
+            self.pending[auction_id] = (price, seq, replaced_seqs)
+            return
+
+        self._start_interval(auction_id)
+        await self.send(auction_id, price, seq, [])
+
+    # sends the price still waiting for the interval to pass right away, e.g. when the auction has ended
+    async def flush(self, auction_id: int) -> None:
+        timer = self.timers.pop(auction_id, None)
+        if timer is not None:
+            timer.cancel()
+
+        pending = self.pending.pop(auction_id, None)
+        if pending is not None:
+            await self.send(auction_id, *pending)
+
+    def _start_interval(self, auction_id: int) -> None:
+        self.timers[auction_id] = self.loop.call_later(self.interval, self._end_interval, auction_id)
+
+    def _end_interval(self, auction_id: int) -> None:
+        del self.timers[auction_id]
+        pending = self.pending.pop(auction_id, None)
+        if pending is None:
+            return  # nothing came in, the next update is sent right away
+
+        # the trailing update starts a new interval, so a bidding war never sends more than max_rate updates
+        self._start_interval(auction_id)
+        task = asyncio.create_task(self._send_pending(auction_id, pending))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _send_pending(self, auction_id: int, pending: tuple[float, int, list[int]]) -> None:
+        try:
+            await self.send(auction_id, *pending)
+        except Exception as e:
+            logger.error(f"Failed to send the price update of auction {auction_id}: {e}")
+
+    def __len__(self):
+        return len(self.timers)
+
+
+# users connected to this socket server, per-user pushes go through the user rooms
 class SocketManager:
     def __init__(self):
         self.user_sessions = {}
@@ -67,17 +181,18 @@ class SocketManager:
     def get_user(self, sid: str) -> SocketUser | None:
         return self.user_sessions.get(sid)
 
-    def get_user_by_user_id(self, user_id: str) -> SocketUser | None:
-        for sid, user in self.user_sessions.items():
-            if user.user_id == user_id:
-                return user
-        return None
+    @staticmethod
+    async def send_action_to_user(user_id: str, data: str):
+        await sio.emit('action', data=data, room=user_room(user_id))
+        logger.trace(f"Sent {data} to user {user_id}")
 
-    async def send_action_to_user(self, user_id: str, data: str):
-        user = self.get_user_by_user_id(user_id)
-        if user:
-            await sio.emit('action', data=data, room=user.sid)
-            logger.trace(f"Sent {data} to {user}")
+    # every event sent to an auction room carries the seq taken by the transaction that made the change,
+    # whichever node sends it, the other socket servers add it to their log when it comes in through the queue
+    @staticmethod
+    async def send_auction_event(auction_id: int, event: WebSocketAction, data: dict, seq: int):
+        data = {**data, "seq": seq}
+        get_auction_event_log().add(auction_id, event.value, data)
+        await sio.emit(event, data=data, room=auction_id)
 
     @staticmethod
     async def send_action_to_auction(auction_id: int, data: str):
@@ -85,16 +200,44 @@ class SocketManager:
         logger.trace(f"Sent {data} to auction {auction_id}")
 
     @staticmethod
-    async def bid_price_update_action(auction_id: int, new_bid_value: float):
-        await sio.emit(WebSocketAction.BID_PRICE_UPDATE, data={"price": new_bid_value}, room=auction_id)
+    async def bid_price_update_action(auction_id: int, new_bid_value: float, seq: int):
+        await get_price_update_throttle().update(auction_id, new_bid_value, seq)
 
-    async def bid_winner_update_action(self, user_id: str):
-        user = self.get_user_by_user_id(user_id)
-        if not user:
-            logger.trace(f"Failed to send bid_winner_update to {user_id} - user not found")
-            return
+    # coalesced updates are never sent, clients count the seqs in replaced_seqs as seen
+    @staticmethod
+    async def send_bid_price_update(auction_id: int, new_bid_value: float, seq: int, replaced_seqs: list[int]):
+        data = {"price": new_bid_value}
+        if replaced_seqs:
+            data["replaced_seqs"] = replaced_seqs
+        await SocketManager.send_auction_event(auction_id, WebSocketAction.BID_PRICE_UPDATE, data, seq)
 
-        await sio.emit(WebSocketAction.BID_WINNER_UPDATE, data={}, room=user.sid)
+    @staticmethod
+    async def auction_extended_action(auction_id: int, end_date: datetime, seq: int):
+        await SocketManager.send_auction_event(auction_id, WebSocketAction.AUCTION_EXTENDED,
+                                               {"end_date": end_date.isoformat()}, seq)
+
+    # a single emit to the auction room, however many users follow it
+    @staticmethod
+    async def auction_ending_soon_action(auction_id: int, end_date: datetime, seq: int):
+        await SocketManager.send_auction_event(auction_id, WebSocketAction.AUCTION_ENDING_SOON,
+                                               {"end_date": end_date.isoformat()}, seq)
+
+    # followers hear about the end first, then the room and their subscriptions to it are dropped
+    async def auction_ended_action(self, auction_id: int, price: float, winner_id: int | None, seq: int):
+        await get_price_update_throttle().flush(auction_id)
+        await self.send_auction_event(auction_id, WebSocketAction.AUCTION_ENDED,
+                                      {"price": price, "winner_id": winner_id}, seq)
+
+        for sid, _ in list(sio.manager.get_participants('/', auction_id)):
+            user = self.get_user(sid)
+            if user:
+                user.forget_auction(auction_id)
+        await sio.close_room(auction_id)
+        logger.trace(f"Closed the room of ended auction {auction_id}")
+
+    @staticmethod
+    async def bid_winner_update_action(user_id: str):
+        await sio.emit(WebSocketAction.BID_WINNER_UPDATE, data={}, room=user_room(user_id))
 
 
 socket_manager_obj = None
@@ -107,6 +250,16 @@ def get_socket_manager():
     return socket_manager_obj
 
 
+price_update_throttle_obj = None
+
+
+def get_price_update_throttle() -> PriceUpdateThrottle:
+    global price_update_throttle_obj
+    if price_update_throttle_obj is None:
+        price_update_throttle_obj = PriceUpdateThrottle(SocketManager.send_bid_price_update)
+    return price_update_throttle_obj
+
+
 @sio.event
 async def connect(sid, environ):
     token = environ.get('HTTP_AUTHORIZATION')
@@ -118,6 +271,7 @@ async def connect(sid, environ):
         return False
 
     get_socket_manager().add_user(sid, socket_user)
+    await sio.enter_room(sid, user_room(socket_user.user_id))
     logger.info(f"{socket_user} connected")
 
 
@@ -144,4 +298,40 @@ async def follow_auction(sid, data):
         await socket_user.send_message("Auction ID is required")
         return
 
+    # rooms are keyed by the integer id the updates are sent to
+    try:
+        auction_id = int(auction_id)
+    except (TypeError, ValueError):
+        await socket_user.send_message("Auction ID must be a number")
+        return
+
     await socket_user.follow_auction(auction_id)
+
+
+# a client that has missed events (dropped packet, reconnect) asks for the ones after the last seq it has seen,
+# the answer is the missed events or, when they are no longer kept, a new snapshot
+@sio.event
+async def resync(sid, data):
+    socket_user: SocketUser = get_socket_manager().get_user(sid)
+    if socket_user is None:
+        logger.trace(f"unauthorized resync: {sid}")
+        return {"error": "Unauthorized"}
+
+    try:
+        auction_id, seq = int(data['auction_id']), int(data['seq'])
+    except (KeyError, TypeError, ValueError):
+        return {"error": "Auction ID and seq are required"}
+
+    events = get_auction_event_log().events_after(auction_id, seq)
+    if events is not None:
+        return {"auction_id": auction_id, "events": events}
+
+    # the seq comes with the state it is read with, an event sent in the meantime is either in both or in neither
+    async with async_session_maker() as session:
+        snapshot = await load_auction_snapshot(session, auction_id)
+    if snapshot is None:
+        return {"error": f"Auction {auction_id} not found"}
+    state, seq = snapshot
+
+    get_metrics().increment("resync_snapshots")
+    return {"auction_id": auction_id, "snapshot": state.to_snapshot(seq)}
@@ -1,45 +1,166 @@
+import heapq
 import threading
-from datetime import datetime
-
-from apscheduler.schedulers.background import BackgroundScheduler
+from datetime import datetime, timedelta
 
 import repos.auction_repo
-import services.auction_service
+import tasks.settlement_task
 from db_management.database import session_maker
-from utils.constants import fastapi_logger as logger, AuctionType, AuctionStatus
+from utils.constants import fastapi_logger as logger, EXPIRY_TRACKER_MAX_SLEEP, AUCTION_ENDING_SOON_REMINDER
 
-# Task to check if an auction has ended
-tracked_auctions = {}  # <auction_id>: <end_time>
-lock = threading.Lock()
+# kinds of heap entries, an auction ends after its reminder when both fall on the same time
+REMINDER = 0
+END = 1
 
 
-# reload all tracked auctions
-def reload_tracked_auctions():
-    with lock:
+# wake-up hint for the settlement runner: the worker thread sleeps until the next tracked auction ends
+# (or its "ending soon" reminder is due, reminder_lead seconds before) and wakes the runner up then,
+# instead of leaving it to its next poll. The settlement jobs and reminders themselves are stored in the database
+# and only driven by the settlement leader, a node missing an auction here only makes it wait for that poll
+class AuctionExpiryTracker:
+    def __init__(self, reminder_lead: float = AUCTION_ENDING_SOON_REMINDER):
+        self.tracked_auctions: dict[int, datetime] = {}  # <auction_id>: <end_time>
+        self.reminders: dict[int, datetime] = {}  # <auction_id>: <remind_time>, only the ones not due yet
+        self.reminder_lead = timedelta(seconds=reminder_lead)
+        self.heap: list[tuple[datetime, int, int]] = []  # (time, kind, auction_id), may hold outdated entries
+        self.condition = threading.Condition()
+        self.thread: threading.Thread | None = None
+        self.running = False
+
+    def track(self, auction_id: int, end_date: datetime) -> None:
+        with self.condition:
+            self.tracked_auctions[auction_id] = end_date
+            heapq.heappush(self.heap, (end_date, END, auction_id))
+            self._schedule_reminder(auction_id, end_date, datetime.now())
+            if len(self.heap) > 2 * (len(self.tracked_auctions) + len(self.reminders)) + 64:
+                self._compact()
+
+            # worker may be sleeping for an auction ending later than this one
+            if self.heap[0][2] == auction_id:
+                self.condition.notify()
+
+    # a reminder that is already late (e.g. the auction has been extended after it was sent) is not sent
+    def _schedule_reminder(self, auction_id: int, end_date: datetime, now: datetime) -> None:
+        remind_at = end_date - self.reminder_lead
+        if not self.reminder_lead or remind_at <= now:
+            self.reminders.pop(auction_id, None)
+            return
+
+        self.reminders[auction_id] = remind_at
+        heapq.heappush(self.heap, (remind_at, REMINDER, auction_id))
+
+    # outdated heap entries are skipped when they come up, instead of searching for them now
+    def untrack(self, auction_id: int) -> None:
+        with self.condition:
+            self.tracked_auctions.pop(auction_id, None)
+            self.reminders.pop(auction_id, None)
+
+    # full reload, only needed at startup, new auctions are tracked one by one
+    # auctions that ended before ends_after are left to the catch-up
+    def reload(self, ends_after: datetime | None = None) -> None:
         with session_maker() as session:
-            auctions = repos.auction_repo.get_all_auctions(session)
-            for auction in auctions:
-                if auction.auction_type == AuctionType.BUY_NOW:
-                    continue
-                if not auction.auction_status == AuctionStatus.ACTIVE:
-                    continue
-
-                tracked_auctions[auction.id] = auction.end_date
-            logger.trace(f"Reloaded {len(tracked_auctions)} tracked auctions")
-
-
-def check_auctions():
-    # prevent checking if auctions are reloading
-    with lock:
-        for auction_id in list(tracked_auctions.keys()):
-            logger.trace(
-                f"Checking auction {auction_id} it expires at {tracked_auctions[auction_id]} (left: {tracked_auctions[auction_id] - datetime.now()})")
-            if tracked_auctions[auction_id] <= datetime.now():
-                logger.info(f"Auction {auction_id} has ended")
-                with session_maker() as session:
-                    services.auction_service.bid_finished(session, auction_id)
-                del tracked_auctions[auction_id]
-
-
-scheduler = BackgroundScheduler()
-scheduler.add_job(check_auctions, 'interval', seconds=60)  # Check every minute
+            tracked_auctions = dict(repos.auction_repo.get_active_auction_end_dates(session, ends_after))
+        now = datetime.now()
+
+        with self.condition:
+            self.tracked_auctions = tracked_auctions
+            self.reminders = {auction_id: end_date - self.reminder_lead for auction_id, end_date in
+                              tracked_auctions.items() if self.reminder_lead and end_date - self.reminder_lead > now}
+            self._compact()
+            self.condition.notify()
+        logger.trace(f"Reloaded {len(tracked_auctions)} tracked auctions")
+
+    # drops outdated entries once they make up most of the heap
+    def _compact(self) -> None:
+        self.heap = [(end_date, END, auction_id) for auction_id, end_date in self.tracked_auctions.items()]
+        self.heap.extend((remind_at, REMINDER, auction_id) for auction_id, remind_at in self.reminders.items())
+        heapq.heapify(self.heap)
+
+    # untracked or rescheduled since it was pushed
+    def _is_outdated(self, entry: tuple[datetime, int, int]) -> bool:
+        when, kind, auction_id = entry
+        scheduled = self.tracked_auctions if kind == END else self.reminders
+        return scheduled.get(auction_id) != when
+
+    # (kind, auction_id) of the entries due now
+    def _pop_due(self, now: datetime) -> list[tuple[int, int]]:
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            entry = heapq.heappop(self.heap)
+            if self._is_outdated(entry):
+                continue
+
+            _, kind, auction_id = entry
+            if kind == REMINDER:
+                del self.reminders[auction_id]
+            else:
+                del self.tracked_auctions[auction_id]
+                self.reminders.pop(auction_id, None)
+            due.append((kind, auction_id))
+        return due
+
+    def _seconds_until_next(self, now: datetime) -> float:
+        while self.heap and self._is_outdated(self.heap[0]):
+            heapq.heappop(self.heap)
+
+        if not self.heap:
+            return EXPIRY_TRACKER_MAX_SLEEP
+
+        # wake up now and then anyway, in case the system clock has been changed
+        return min((self.heap[0][0] - now).total_seconds(), EXPIRY_TRACKER_MAX_SLEEP)
+
+    # the runner of a node that is not the leader goes back to sleep, the leader gets there by polling
+    def _wake(self, due: list[tuple[int, int]]) -> None:
+        logger.trace(f"Waking up the settlement runner for {len(due)} due auctions")
+        tasks.settlement_task.get_settlement_runner().wakeup.set()
+
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                due = []
+                while self.running and not due:
+                    now = datetime.now()
+                    due = self._pop_due(now)
+                    if not due:
+                        self.condition.wait(self._seconds_until_next(now))
+
+                if not self.running:
+                    return
+
+            # outside of the lock, so auctions can be tracked in the meantime
+            self._wake(due)
+
+    def start(self) -> None:
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+
+        self.thread = threading.Thread(target=self._run, name="auction-expiry-tracker", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+            self.thread = None
+
+    def __len__(self):
+        return len(self.tracked_auctions)
+
+
+expiry_tracker_obj = None
+
+
+def get_expiry_tracker() -> AuctionExpiryTracker:
+    global expiry_tracker_obj
+    if expiry_tracker_obj is None:
+        expiry_tracker_obj = AuctionExpiryTracker()
+    return expiry_tracker_obj
+
+
+# reload all tracked auctions
+def reload_tracked_auctions(ends_after: datetime | None = None):
+    get_expiry_tracker().reload(ends_after)
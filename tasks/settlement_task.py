@@ -0,0 +1,262 @@
+import os
+import socket
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import repos.auction_repo
+import repos.settlement_repo
+import services.auction_service
+from db_management.database import session_maker
+from services.auction_cache_service import get_auction_cache
+from services.metrics_service import get_metrics
+from services.outbox_service import get_outbox
+from services.socketio_service import get_socket_manager, SocketManager
+from utils.constants import fastapi_logger as logger, AuctionStatus, SETTLEMENT_WORKERS, SETTLEMENT_POLL_INTERVAL, \
+    SETTLEMENT_JOB_LEASE, SETTLEMENT_MAX_ATTEMPTS, SETTLEMENT_RETRY_BACKOFF, SETTLEMENT_RETRY_MAX_BACKOFF, \
+    LEADER_LEASE_TTL, CATCH_UP_BATCH_SIZE, AUCTION_ENDING_SOON_REMINDER
+
+LEADER_LEASE_NAME = "auction_settlement"
+
+
+# runs the settlement jobs stored in the database and sends the "ending soon" reminders,
+# only on the node currently holding the leader lease
+class SettlementRunner:
+    def __init__(self, session_factory=session_maker, node_id: str | None = None,
+                 reminder_lead: float = AUCTION_ENDING_SOON_REMINDER):
+        self.session_factory = session_factory
+        self.node_id = node_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.reminder_lead = timedelta(seconds=reminder_lead)
+        self.catch_up_before: datetime | None = None
+        self.is_leader = False
+        self.in_flight = 0
+        self.in_flight_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread: threading.Thread | None = None
+        self.executor: ThreadPoolExecutor | None = None
+        self.running = False
+
+    # jobs are stored with their auctions, this only moves one, safe to call from every node
+    def enqueue(self, auction_id: int, run_at: datetime | None = None) -> None:
+        with self.session_factory() as session:
+            repos.settlement_repo.enqueue_settlement_job(session, auction_id, run_at or datetime.now())
+            session.commit()
+        self.wakeup.set()
+
+    def renew_leadership(self) -> bool:
+        try:
+            with self.session_factory() as session:
+                is_leader = repos.settlement_repo.try_acquire_lease(session, LEADER_LEASE_NAME, self.node_id,
+                                                                   datetime.now(), LEADER_LEASE_TTL)
+                session.commit()
+        except Exception as e:
+            logger.error(f"Failed to renew the settlement leader lease: {e}")
+            is_leader = False
+
+        if is_leader != self.is_leader:
+            logger.info(f"Node {self.node_id} {'is now' if is_leader else 'is no longer'} the settlement leader")
+        self.is_leader = is_leader
+        return is_leader
+
+    # claims as many due jobs as there are free workers
+    def claim_jobs(self) -> list[tuple[int, int]]:
+        with self.in_flight_lock:
+            limit = SETTLEMENT_WORKERS - self.in_flight
+        if limit <= 0:
+            return []
+
+        with self.session_factory() as session:
+            jobs = repos.settlement_repo.claim_due_jobs(session, self.node_id, datetime.now(), SETTLEMENT_JOB_LEASE,
+                                                        limit)
+            session.commit()
+        return jobs
+
+    def run_job(self, job_id: int, auction_id: int) -> None:
+        try:
+            with self.session_factory() as session:
+                extended_end_date = services.auction_service.auction_finished(session, auction_id)
+        except Exception as e:
+            self._retry_job(job_id, auction_id, e)
+            return
+
+        # extended by a soft close after the job had been claimed, it runs again at the new end date
+        if extended_end_date is not None:
+            with self.session_factory() as session:
+                repos.settlement_repo.reschedule_job(session, job_id, self.node_id, extended_end_date)
+                session.commit()
+            get_metrics().increment("settlement_jobs_rescheduled")
+            return
+
+        with self.session_factory() as session:
+            repos.settlement_repo.complete_job(session, job_id, self.node_id)
+            session.commit()
+        get_metrics().increment("settlement_jobs_done")
+
+    def _retry_job(self, job_id: int, auction_id: int, error: Exception) -> None:
+        with self.session_factory() as session:
+            attempts = repos.settlement_repo.get_job_attempts(session, job_id)
+            retry_at = None
+            if attempts < SETTLEMENT_MAX_ATTEMPTS:
+                backoff = min(SETTLEMENT_RETRY_BACKOFF * 2 ** (attempts - 1), SETTLEMENT_RETRY_MAX_BACKOFF)
+                retry_at = datetime.now() + timedelta(seconds=backoff)
+            repos.settlement_repo.fail_job(session, job_id, self.node_id, str(error), retry_at)
+            session.commit()
+
+        if retry_at is None:
+            get_metrics().increment("settlement_jobs_failed")
+            logger.error(f"Settlement of auction {auction_id} has failed {attempts} times, giving up: {error}")
+        else:
+            get_metrics().increment("settlement_jobs_retried")
+            logger.warning(f"Settlement of auction {auction_id} has failed (attempt {attempts}), retrying at {retry_at}: {error}")
+
+    # settles everything that ended while no node was running, one transaction per batch:
+    # auctions without a winner (including unsold buy now ones) are closed with a single update,
+    # the others are queued as jobs (emails, balances)
+    def catch_up(self, ended_before: datetime) -> None:
+        metrics = get_metrics()
+        with self.session_factory() as session:
+            total = repos.auction_repo.count_overdue_auctions(session, ended_before)
+        metrics.set_gauge("catch_up_total", total)
+        metrics.set_gauge("catch_up_processed", 0)
+        if total == 0:
+            return
+
+        logger.info(f"Catching up with {total} auctions that ended during downtime")
+        processed, last_id = 0, 0
+        while True:
+            with self.session_factory() as session:
+                batch = repos.auction_repo.get_overdue_auctions(session, ended_before, last_id, CATCH_UP_BATCH_SIZE)
+                if not batch:
+                    break
+
+                unsold = [auction_id for auction_id, winner_id in batch if winner_id is None]
+                sold = [auction_id for auction_id, winner_id in batch if winner_id is not None]
+                closed = repos.auction_repo.close_auctions(session, unsold) if unsold else {}
+                if sold:
+                    repos.settlement_repo.enqueue_settlement_jobs(session, sold, datetime.now())
+                session.commit()
+
+            for auction_id in closed:
+                get_auction_cache().update(auction_id, auction_status=AuctionStatus.INACTIVE)
+            # every closed auction has taken the seq of its auction_ended event, the followers get it too
+            if closed:
+                get_outbox().publish([(get_socket_manager().auction_ended_action, (auction_id, None, None, seq))
+                                      for auction_id, seq in closed.items()])
+
+            last_id = batch[-1][0]
+            processed += len(batch)
+            metrics.set_gauge("catch_up_processed", processed)
+            self.wakeup.set()
+            logger.trace(f"Caught up with {processed}/{total} ended auctions")
+
+        logger.info(f"Caught up with {processed} auctions that ended during downtime")
+
+    # every reminder is claimed with a compare-and-swap update, so a node that has just lost the lead
+    # and still gets here cannot send one twice, all reminders due together are handed to the event loop at once
+    def send_reminders(self) -> None:
+        if not self.reminder_lead:
+            return
+
+        now = datetime.now()
+        with self.session_factory() as session:
+            end_dates = dict(repos.auction_repo.get_due_reminders(session, now, now + self.reminder_lead))
+            if not end_dates:
+                return
+            claimed = repos.auction_repo.claim_ending_soon_reminders(session, list(end_dates))
+            session.commit()
+
+        if not claimed:
+            return
+        get_outbox().publish([(SocketManager.auction_ending_soon_action, (auction_id, end_dates[auction_id], seq))
+                              for auction_id, seq in claimed.items()])
+        get_metrics().increment("auction_reminders_sent", len(claimed))
+        logger.trace(f"Sent ending soon reminders of {len(claimed)} auctions")
+
+    # run by the first node to become the leader, the others leave the overdue auctions to its jobs
+    def start_catch_up(self, ended_before: datetime) -> None:
+        self.catch_up_before = ended_before
+
+    def _start_pending_catch_up(self) -> None:
+        if self.catch_up_before is None:
+            return
+        ended_before, self.catch_up_before = self.catch_up_before, None
+
+        def run():
+            try:
+                self.catch_up(ended_before)
+            except Exception as e:
+                logger.error(f"Failed to catch up with auctions that ended during downtime: {e}")
+
+        threading.Thread(target=run, name="settlement-catch-up", daemon=True).start()
+
+    def _submit(self, job_id: int, auction_id: int) -> None:
+        with self.in_flight_lock:
+            self.in_flight += 1
+
+        def run():
+            try:
+                self.run_job(job_id, auction_id)
+            except Exception as e:
+                logger.error(f"Failed to record the settlement of auction {auction_id}: {e}")
+            finally:
+                with self.in_flight_lock:
+                    self.in_flight -= 1
+                self.wakeup.set()
+
+        self.executor.submit(run)
+
+    def _run(self) -> None:
+        while self.running:
+            self.wakeup.clear()
+            if self.renew_leadership():
+                self._start_pending_catch_up()
+                try:
+                    for job_id, auction_id in self.claim_jobs():
+                        self._submit(job_id, auction_id)
+                except Exception as e:
+                    logger.error(f"Failed to claim settlement jobs: {e}")
+
+                try:
+                    self.send_reminders()
+                except Exception as e:
+                    logger.error(f"Failed to send ending soon reminders: {e}")
+
+            self.wakeup.wait(SETTLEMENT_POLL_INTERVAL)
+
+    def start(self) -> None:
+        if self.running:
+            return
+
+        self.running = True
+        self.executor = ThreadPoolExecutor(max_workers=SETTLEMENT_WORKERS, thread_name_prefix="auction-settlement")
+        self.thread = threading.Thread(target=self._run, name="settlement-runner", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.running = False
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+            self.thread = None
+
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+        # let another node take over right away
+        if self.is_leader:
+            with self.session_factory() as session:
+                repos.settlement_repo.release_lease(session, LEADER_LEASE_NAME, self.node_id)
+                session.commit()
+            self.is_leader = False
+
+
+settlement_runner_obj = None
+
+
+def get_settlement_runner() -> SettlementRunner:
+    global settlement_runner_obj
+    if settlement_runner_obj is None:
+        settlement_runner_obj = SettlementRunner()
+    return settlement_runner_obj
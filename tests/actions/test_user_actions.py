@@ -1,10 +1,19 @@
+from datetime import datetime, timedelta
+
 import pytest
 from httpx import AsyncClient, ASGITransport
 
 import repos.auction_repo
 import repos.user_repo
-from db_management.dto import BuyNow, PlaceBid
+from db_management.dto import BuyNow, PlaceBid, PlaceProxyBid, CreateAuction, CreateAuctionProduct, \
+    PersonalRegisterForm, AccountDetails, PersonalBilling
+from db_management.models import SettlementJob
 from main import app
+from response_models.auth_responses import create_access_token
+from services.auction_service import create_auction
+from services.user_service import create_personal_account
+from tasks.auction_finished_task import get_expiry_tracker
+from utils.constants import AuctionType, SOFT_CLOSE_WINDOW, SOFT_CLOSE_EXTENSION
 
 
 @pytest.mark.asyncio
@@ -51,6 +60,9 @@ async def test_buy_now():
         assert response.status_code == 200
         assert response.json()['balance_total'] == user_balance_before - test_auction.buy_now_price
 
+        # sold auction is left out of the listings of live auctions
+        assert repos.auction_repo.search_auctions_by_name(session, "Katana magiczna", active_only=True) == []
+
         # verify if the auction is inactive
         response = await ac.get(f"/auction/id/{test_auction.id}")
         assert response.status_code == 200
@@ -108,3 +120,110 @@ async def test_bid():
         assert response.json()['bid']['current_bid_value'] == 15
         assert response.json()['bid']['current_bid_winner']['id'] == user_id
         assert response.json()['is_auction_finished'] is False
+
+
+def create_bidder(session, username: str, balance: float):
+    bidder = create_personal_account(session, PersonalRegisterForm(
+        account_details=AccountDetails(username=username, password="Dawid123!", email=f"{username}@gmail.com"),
+        billing_details=PersonalBilling(first_name="Jan", last_name="Kowalski", address="Lipowa 1",
+                                        postal_code="15-369", city="Białystok", state="Podlaskie",
+                                        country="Poland", phone_number="515555454"),
+    ))
+    bidder.balance_total = balance
+    session.commit()
+    return bidder
+
+
+@pytest.mark.asyncio
+async def test_proxy_bid():
+    async with AsyncClient(transport=ASGITransport(app=app),
+                           base_url="http://test", verify=False, follow_redirects=True) as ac:
+        from db_management.database_tests import override_get_db
+        session = next(override_get_db())
+
+        # prepare auction and two fresh bidders
+        category = repos.auction_repo.get_categories(session)[0]
+        create_auction(session, CreateAuction(
+            auction_type=AuctionType.BID, end_date=datetime.now() + timedelta(days=1), price=5,
+            product=CreateAuctionProduct(name="Gruszka", description="Soczysta gruszka", category_id=category.id,
+                                         images=["http://res.cloudinary.com/sample-image.jpg"]),
+        ), pytest.company_account_id)
+        test_auction = repos.auction_repo.search_auctions_by_name(session, "Gruszka")[0]
+
+        proxy_bidder = create_bidder(session, "proxy_bidder", 1000)
+        manual_bidder = create_bidder(session, "manual_bidder", 1000)
+        proxy_headers = {"Authorization": f"Bearer {create_access_token(proxy_bidder)}"}
+        manual_headers = {"Authorization": f"Bearer {create_access_token(manual_bidder)}"}
+
+        # maximum above the balance (should fail)
+        proxy_dto = PlaceProxyBid(auction_id=test_auction.id, max_bid_value=5000)
+        response = await ac.post(f"/auction/proxy_bid", json=proxy_dto.dict(), headers=proxy_headers)
+        assert response.status_code == 400
+
+        # register proxy bid, user becomes the winner with the lowest possible price
+        proxy_dto.max_bid_value = 50
+        response = await ac.post(f"/auction/proxy_bid", json=proxy_dto.dict(), headers=proxy_headers)
+        assert response.status_code == 200
+
+        response = await ac.get(f"/auction/id/{test_auction.id}")
+        assert response.json()['bid']['current_bid_value'] == 6
+        assert response.json()['bid']['current_bid_winner']['id'] == proxy_bidder.id
+
+        # manual bid is answered by the proxy bid right away
+        bid_dto = PlaceBid(auction_id=test_auction.id, bid_value=10)
+        response = await ac.post(f"/auction/bid", json=bid_dto.dict(), headers=manual_headers)
+        assert response.status_code == 200
+
+        response = await ac.get(f"/auction/id/{test_auction.id}")
+        assert response.json()['bid']['current_bid_value'] == 17
+        assert response.json()['bid']['current_bid_winner']['id'] == proxy_bidder.id
+
+        # lower proxy bid loses against the higher one, price is raised just above it
+        proxy_dto.max_bid_value = 30
+        response = await ac.post(f"/auction/proxy_bid", json=proxy_dto.dict(), headers=manual_headers)
+        assert response.status_code == 200
+
+        response = await ac.get(f"/auction/id/{test_auction.id}")
+        assert response.json()['bid']['current_bid_value'] == 31
+        assert response.json()['bid']['current_bid_winner']['id'] == proxy_bidder.id
+
+        # both users participate, the manual bid and the automatic raises are in the history
+        response = await ac.get(f"/auction/stats/{test_auction.id}")
+        assert response.json()['participants_count'] == 2
+        assert response.json()['total_bids'] == 4
+
+
+@pytest.mark.asyncio
+async def test_soft_close():
+    async with AsyncClient(transport=ASGITransport(app=app),
+                           base_url="http://test", verify=False, follow_redirects=True) as ac:
+        from db_management.database_tests import override_get_db
+        session = next(override_get_db())
+
+        # auction about to end
+        category = repos.auction_repo.get_categories(session)[0]
+        end_date = datetime.now() + timedelta(seconds=SOFT_CLOSE_WINDOW // 2)
+        create_auction(session, CreateAuction(
+            auction_type=AuctionType.BID, end_date=end_date, price=5,
+            product=CreateAuctionProduct(name="Cytryna", description="Kwasna cytryna", category_id=category.id,
+                                         images=["http://res.cloudinary.com/sample-image.jpg"]),
+        ), pytest.company_account_id)
+        test_auction = repos.auction_repo.search_auctions_by_name(session, "Cytryna")[0]
+        bidder = create_bidder(session, "last_second_bidder", 1000)
+
+        # last second bid moves the end of the auction
+        bid_dto = PlaceBid(auction_id=test_auction.id, bid_value=10)
+        response = await ac.post(f"/auction/bid", json=bid_dto.dict(),
+                                 headers={"Authorization": f"Bearer {create_access_token(bidder)}"})
+        assert response.status_code == 200
+
+        response = await ac.get(f"/auction/id/{test_auction.id}")
+        extended_end_date = datetime.fromisoformat(response.json()['end_date'])
+        assert extended_end_date > end_date
+        assert extended_end_date - datetime.now() <= timedelta(seconds=SOFT_CLOSE_EXTENSION)
+
+        # auction is settled at the new end date, the runner is woken up then
+        job = session.query(SettlementJob).where(SettlementJob.auction_id == test_auction.id).one()
+        session.refresh(job)
+        assert job.run_at == extended_end_date
+        assert get_expiry_tracker().tracked_auctions[test_auction.id] == extended_end_date
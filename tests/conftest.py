@@ -2,6 +2,7 @@ import asyncio
 from datetime import datetime, timedelta
 
 import pytest
+import pytest_asyncio
 
 import repos.auction_repo
 import repos.user_repo
@@ -11,6 +12,7 @@ from db_management.dto import PersonalRegisterForm, AccountDetails, PersonalBill
 from main import start_socketio, start_socketio_sync
 from response_models.auth_responses import create_access_token
 from services.auction_service import create_auction
+from services.outbox_service import get_outbox
 from services.user_service import create_personal_account, create_company_account
 from utils.constants import AuctionType, UserAccountType
 
@@ -128,6 +130,13 @@ def setup_test_database():
     session.commit()
 
 
+# the outbox dispatcher is started lazily on the loop of the test, it is stopped before that loop is closed
+@pytest_asyncio.fixture(autouse=True)
+async def outbox_dispatcher():
+    yield
+    await get_outbox().stop()
+
+
 async def start_socketio_test():
     print("Serwer Socket.IO uruchomiony")
     await asyncio.sleep(30)  # Symulacja działania serwera
@@ -1,7 +1,9 @@
 import pytest
 from httpx import AsyncClient, ASGITransport
+from sqlalchemy import select, text
 
 import repos.auction_repo
+from db_management.models import Auction
 from main import app
 
 
@@ -108,3 +110,31 @@ async def test_get_auctions_stats():
         # test with non-existing auction
         response = await ac.get(f"/auction/stats/1000")
         assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_get_latest_active_only():
+    from db_management.database_tests import override_get_db
+    session = next(override_get_db())
+
+    # finished auctions are filtered out by the database, with the same rules as in python
+    live = repos.auction_repo.get_latest_auctions(session, 100, active_only=True)
+    assert all(not auction.is_auction_finished for auction in live)
+    assert len(live) == len([auction for auction in repos.auction_repo.get_latest_auctions(session, 100)
+                             if not auction.is_auction_finished])
+
+    async with AsyncClient(transport=ASGITransport(app=app),
+                           base_url="http://test", verify=False, follow_redirects=True) as ac:
+        response = await ac.get("/auction/last", params={"active_only": True})
+        assert response.status_code == 200
+        assert all(not product['is_auction_finished'] for product in response.json()['products'])
+
+
+def test_live_filter_uses_the_status_end_date_index():
+    from db_management.database_tests import override_get_db
+    session = next(override_get_db())
+
+    query = select(Auction.id).where(Auction.is_auction_live).compile(
+        session.bind, compile_kwargs={"literal_binds": True})
+    plan = session.execute(text(f"EXPLAIN QUERY PLAN {query}")).all()
+    assert "ix_auction_auction_status_end_date" in " ".join(row[-1] for row in plan)
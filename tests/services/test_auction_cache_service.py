@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+
+from services.auction_cache_service import AuctionCache, AuctionState
+from utils.constants import AuctionType, AuctionStatus
+
+
+def create_state(auction_id: int, end_date: datetime = None) -> AuctionState:
+    return AuctionState(auction_id, AuctionType.BID, AuctionStatus.ACTIVE, 1,
+                        end_date or datetime.now() + timedelta(days=3), 5, None, 0)
+
+
+def test_least_recently_used_auction_is_evicted():
+    cache = AuctionCache(max_size=2, ttl=60)
+    cache.put(create_state(1))
+    cache.put(create_state(2))
+
+    # reading auction 1 makes auction 2 the oldest one
+    assert cache.get(1) is not None
+    cache.put(create_state(3))
+
+    assert len(cache) == 2
+    assert cache.get(2) is None
+    assert cache.get(1) is not None
+    assert cache.get(3) is not None
+
+
+def test_expired_auction_is_reloaded():
+    cache = AuctionCache(max_size=2, ttl=0)
+    cache.put(create_state(1), {"id": 1})
+
+    assert cache.get(1) is None
+    assert len(cache) == 0
+
+
+def test_write_through_drops_cached_view():
+    cache = AuctionCache(max_size=2, ttl=60)
+    cache.put(create_state(1), {"id": 1, "price": 5})
+    assert cache.get_view(1)["price"] == 5
+
+    cache.record_bid(1, 15, 7, 2)
+    state = cache.get(1)
+    assert (state.price, state.winner_id, state.bid_count) == (15, 7, 2)
+    assert cache.get_view(1) is None
+
+    # unknown auctions are left to be loaded on the next read
+    cache.record_bid(2, 15, 7, 1)
+    assert cache.get(2) is None
+
+
+def test_cached_view_follows_the_clock():
+    cache = AuctionCache(max_size=2, ttl=60)
+    cache.put(create_state(1, datetime.now() - timedelta(seconds=1)),
+              {"id": 1, "is_auction_finished": False, "days_left": 3})
+
+    view = cache.get_view(1)
+    assert view["is_auction_finished"] is True
+    assert view["days_left"] == 0
@@ -0,0 +1,82 @@
+import repos.auction_repo
+from services.auction_event_service import AuctionEventLog
+
+
+def add(log: AuctionEventLog, auction_id: int, *seqs: int) -> None:
+    for seq in seqs:
+        log.add(auction_id, "bid_price_update", {"price": seq, "seq": seq})
+
+
+def kept(log: AuctionEventLog, auction_id: int) -> list[int]:
+    return [event["data"]["seq"] for event in log.auctions[auction_id].events]
+
+
+def test_events_are_kept_in_seq_order():
+    log = AuctionEventLog(size=3, max_auctions=10)
+
+    # events of other servers may come in out of order or twice
+    add(log, 1, 1, 3, 2, 3)
+    add(log, 2, 1)
+    assert kept(log, 1) == [1, 2, 3]
+    assert log.last_seq(1) == 3
+    assert log.last_seq(3) == 0
+
+    # the oldest ones make room, anything older than what is kept is dropped
+    add(log, 1, 5, 4, 1)
+    assert kept(log, 1) == [3, 4, 5]
+
+
+def test_only_recent_events_are_resent():
+    log = AuctionEventLog(size=3, max_auctions=10)
+    add(log, 1, 1, 2, 3, 4, 5)
+
+    assert [event["data"]["seq"] for event in log.events_after(1, 3)] == [4, 5]
+    assert [event["data"]["seq"] for event in log.events_after(1, 2)] == [3, 4, 5]
+    assert log.events_after(1, 5) == []
+
+    # the events after seq 1 are no longer all kept, neither is a seq from the future
+    assert log.events_after(1, 1) is None
+    assert log.events_after(1, 6) is None
+    assert log.events_after(2, 0) == []
+
+    # an event that has not come in here yet cannot be skipped
+    add(log, 1, 7)
+    assert log.events_after(1, 5) is None
+
+
+def test_log_is_bounded():
+    log = AuctionEventLog(size=3, max_auctions=2)
+    add(log, 1, 1)
+    add(log, 2, 1)
+    add(log, 1, 2)
+    add(log, 3, 1)
+
+    # auctions without events for the longest time go first
+    assert len(log) == 2
+    assert log.last_seq(2) == 0
+    assert log.last_seq(1) == 2
+
+
+def test_coalesced_updates_are_not_missing():
+    log = AuctionEventLog(size=5, max_auctions=10)
+    add(log, 1, 1, 2)
+    log.add(1, "bid_price_update", {"price": 5, "seq": 5, "replaced_seqs": [3, 4]})
+
+    assert [event["data"]["seq"] for event in log.events_after(1, 2)] == [5]
+    assert [event["data"]["seq"] for event in log.events_after(1, 3)] == [5]
+    assert log.events_after(1, 5) == []
+
+
+def test_seq_is_taken_by_the_writing_transaction():
+    from db_management.database_tests import override_get_db
+    session = next(override_get_db())
+    auction = repos.auction_repo.search_auctions_by_name(session, "Jablko")[0]
+
+    first = repos.auction_repo.increment_event_seq(session, auction.id, 2)
+    session.commit()
+    # a change that is rolled back takes no seq
+    assert repos.auction_repo.increment_event_seq(session, auction.id) == first + 1
+    session.rollback()
+    assert repos.auction_repo.increment_event_seq(session, auction.id) == first + 1
+    assert repos.auction_repo.increment_event_seq(session, 1000000) is None
+    session.commit()
@@ -0,0 +1,156 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+
+import repos.async_auction_repo
+import repos.async_user_repo
+import repos.auction_repo
+import repos.user_repo
+import services.auction_service
+from db_management.dto import PersonalRegisterForm, AccountDetails, PersonalBilling
+from db_management.models import Auction, Bid, BidHistory, Product
+from services.auction_cache_service import get_auction_cache, AuctionState
+from services.auction_service import place_bid, place_proxy_bid
+from services.metrics_service import get_metrics
+from services.user_service import create_personal_account
+from utils.constants import AuctionType, AuctionStatus, SOFT_CLOSE_WINDOW
+
+
+@pytest.mark.asyncio
+async def test_update_bid_winner_detects_concurrent_update():
+    from db_management.database_tests import override_get_db, TestingAsyncSessionLocal
+    other_session = next(override_get_db())
+
+    async with TestingAsyncSessionLocal() as session:
+        auction_id = repos.auction_repo.search_auctions_by_name(other_session, "Jablko")[0].id
+        test_auction = await repos.async_auction_repo.get_auction_by_id(session, auction_id)
+        user = await repos.async_user_repo.get_by_id(session, pytest.company_account_id)
+        bid_id = test_auction.bid_id
+        bid_value_before = test_auction.bid.current_bid_value
+        version_before = test_auction.bid.version
+
+        # another worker changes the bid after we loaded it
+        other_bid = other_session.query(Bid).where(Bid.id == bid_id).first()
+        other_bid.version += 1
+        other_session.commit()
+
+        # stale compare-and-swap must not overwrite the bid
+        assert not await repos.async_auction_repo.update_bid_winner(session, test_auction, user,
+                                                                    bid_value_before + 100)
+        await session.rollback()
+
+        bid = (await session.scalars(select(Bid).where(Bid.id == bid_id))).first()
+        assert bid.current_bid_value == bid_value_before
+        assert bid.version == version_before + 1
+
+
+@pytest.mark.asyncio
+async def test_doomed_bids_are_rejected_from_cache(monkeypatch):
+    auction_id, seller_id, winner_id = 100000, 1, 2
+    get_auction_cache().put(AuctionState(auction_id, AuctionType.BID, AuctionStatus.ACTIVE, seller_id,
+                                         datetime.now() + timedelta(days=1), 10, winner_id, 3))
+    rejections_before = get_metrics().get_counter("bid_fast_rejections")
+    reached_database = []
+
+    async def run_bid_attempts(session, auction_id, user_id, attempt_fn, value):
+        reached_database.append(user_id)
+
+    monkeypatch.setattr(services.auction_service, "_run_bid_attempts", run_bid_attempts)
+
+    with pytest.raises(HTTPException) as e:
+        await place_bid(None, auction_id, seller_id, 5)
+    assert e.value.status_code == 400
+    assert e.value.detail == "You cannot bid on your own auction"
+
+    # the cached winner may have been outbid already, only the database can tell
+    await place_bid(None, auction_id, winner_id, 15)
+    await place_proxy_bid(None, auction_id, winner_id, 50)
+    # so may the cached end date, the auction may have been extended on another worker
+    get_auction_cache().update(auction_id, end_date=datetime.now() - timedelta(seconds=1))
+    await place_bid(None, auction_id, 3, 15)
+    assert reached_database == [winner_id, winner_id, 3]
+
+    get_auction_cache().update(auction_id, auction_status=AuctionStatus.INACTIVE)
+    with pytest.raises(HTTPException) as e:
+        await place_bid(None, auction_id, 3, 5)
+    assert e.value.detail == "This auction is not biddable / already finished"
+
+    assert get_metrics().get_counter("bid_fast_rejections") == rejections_before + 2
+    get_auction_cache().invalidate(auction_id)
+
+
+def create_bid_auction(session, name: str, end_date: datetime) -> Auction:
+    auction = Auction(auction_type=AuctionType.BID, end_date=end_date,
+                      product=Product(name=name, description="Bid auction", category_id=1),
+                      seller_id=pytest.company_account_id, bid=Bid(current_bid_value=5))
+    session.add(auction)
+    session.commit()
+    return auction
+
+
+def create_bidder(session, username: str):
+    bidder = create_personal_account(session, PersonalRegisterForm(
+        account_details=AccountDetails(username=username, password="Dawid123!", email=f"{username}@gmail.com"),
+        billing_details=PersonalBilling(first_name="Jan", last_name="Kowalski", address="Lipowa 1",
+                                        postal_code="15-369", city="Białystok", state="Podlaskie",
+                                        country="Poland", phone_number="515555454"),
+    ))
+    bidder.balance_total = 1000
+    session.commit()
+    return bidder
+
+
+@pytest.mark.asyncio
+async def test_failed_bid_leaves_the_price_unchanged(monkeypatch):
+    from db_management.database_tests import override_get_db, TestingAsyncSessionLocal
+    session = next(override_get_db())
+    auction = create_bid_auction(session, "Pigwa", datetime.now() + timedelta(days=1))
+    bidder = create_bidder(session, "unlucky_bidder")
+
+    # the winner has already been swapped when a later write of the same bid fails
+    def set_frozen_balance(user, amount):
+        raise RuntimeError("Lost connection to the database")
+
+    monkeypatch.setattr(repos.user_repo, "set_frozen_balance", set_frozen_balance)
+    async with TestingAsyncSessionLocal() as async_session:
+        with pytest.raises(RuntimeError):
+            await place_bid(async_session, auction.id, bidder.id, 10)
+
+    session.expire_all()
+    bid = session.query(Bid).where(Bid.id == auction.bid_id).first()
+    assert bid.current_bid_value == 5
+    assert bid.current_bid_winner_id is None
+    assert bid.version == 0
+    assert session.query(BidHistory).where(BidHistory.bid_id == bid.id).count() == 0
+    assert session.query(Auction.event_seq).where(Auction.id == auction.id).scalar() == 0
+    get_auction_cache().invalidate(auction.id)
+
+
+class RecordingOutbox:
+    def __init__(self):
+        self.staged = []
+
+    def stage(self, session, action, *args):
+        self.staged.append((action.__name__, args))
+
+
+@pytest.mark.asyncio
+async def test_bid_takes_the_seqs_of_its_events(monkeypatch):
+    from db_management.database_tests import override_get_db, TestingAsyncSessionLocal
+    outbox = RecordingOutbox()
+    monkeypatch.setattr(services.auction_service, "get_outbox", lambda: outbox)
+    session = next(override_get_db())
+    auction = create_bid_auction(session, "Agrest", datetime.now() + timedelta(seconds=SOFT_CLOSE_WINDOW // 2))
+    bidder = create_bidder(session, "last_minute_bidder")
+
+    async with TestingAsyncSessionLocal() as async_session:
+        await place_bid(async_session, auction.id, bidder.id, 10)
+
+    # the extension and the new price are announced with the seqs the bid has stored
+    session.expire_all()
+    event_seq = session.query(Auction.event_seq).where(Auction.id == auction.id).scalar()
+    events = [(name, args[-1]) for name, args in outbox.staged if name != "bid_winner_update_action"]
+    assert events == [("auction_extended_action", event_seq - 1), ("bid_price_update_action", event_seq)]
+    get_auction_cache().invalidate(auction.id)
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from services.bid_sequencer_service import BidSequencer
+
+
+@pytest.mark.asyncio
+async def test_bids_on_same_auction_are_sequenced():
+    sequencer = BidSequencer()
+    applied = []
+
+    async def bid(value):
+        async with sequencer.sequence(1):
+            # yield to the event loop while holding the lock, other bids must wait
+            await asyncio.sleep(0.01)
+            applied.append(value)
+
+    await asyncio.gather(*(bid(i) for i in range(10)))
+
+    # bids are applied strictly in the order they arrived
+    assert applied == list(range(10))
+
+    # idle auction is evicted
+    assert sequencer.is_idle(1)
+    assert len(sequencer) == 0
+
+
+@pytest.mark.asyncio
+async def test_bids_on_different_auctions_run_in_parallel():
+    sequencer = BidSequencer()
+    first_entered = asyncio.Event()
+    second_entered = asyncio.Event()
+
+    async def first():
+        async with sequencer.sequence(1):
+            first_entered.set()
+            # would dead lock if auction 2 had to wait for auction 1
+            await asyncio.wait_for(second_entered.wait(), timeout=1)
+
+    async def second():
+        async with sequencer.sequence(2):
+            await first_entered.wait()
+            second_entered.set()
+
+    await asyncio.gather(first(), second())
+    assert len(sequencer) == 0
+
+
+@pytest.mark.asyncio
+async def test_sequencer_released_on_error():
+    sequencer = BidSequencer()
+
+    with pytest.raises(ValueError):
+        async with sequencer.sequence(1):
+            raise ValueError("bid rejected")
+
+    assert sequencer.is_idle(1)
+
+    # the next bid can still acquire the auction
+    async with sequencer.sequence(1):
+        assert not sequencer.is_idle(1)
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from services.idempotency_service import IdempotencyStore
+
+
+@pytest.mark.asyncio
+async def test_retried_request_returns_stored_result():
+    store = IdempotencyStore(max_size=10, ttl=60)
+    calls = []
+
+    async def action():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"message": "Bid placed successfully"}
+
+    # duplicates arriving while the first request is still running wait for its result
+    results = await asyncio.gather(*(store.execute("key", 1, "bid", {"auction_id": 1}, action) for _ in range(3)))
+    assert results == [{"message": "Bid placed successfully"}] * 3
+    assert await store.execute("key", 1, "bid", {"auction_id": 1}, action) == results[0]
+    assert len(calls) == 1
+
+    # keys are scoped to the user and the endpoint
+    await store.execute("key", 2, "bid", {"auction_id": 1}, action)
+    await store.execute("key", 1, "buy_now", {"auction_id": 1}, action)
+    assert len(calls) == 3
+
+    # the same key with another payload is refused
+    with pytest.raises(HTTPException) as e:
+        await store.execute("key", 1, "bid", {"auction_id": 2}, action)
+    assert e.value.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_failed_request_is_not_stored():
+    store = IdempotencyStore(max_size=10, ttl=60)
+
+    async def failing_action():
+        raise HTTPException(status_code=409, detail="Too many simultaneous bids on this auction, please try again")
+
+    with pytest.raises(HTTPException):
+        await store.execute("key", 1, "bid", {}, failing_action)
+    assert len(store) == 0
+
+    async def action():
+        return "ok"
+
+    assert await store.execute("key", 1, "bid", {}, action) == "ok"
+
+
+@pytest.mark.asyncio
+async def test_store_is_bounded():
+    store = IdempotencyStore(max_size=2, ttl=0)
+
+    async def action():
+        return "ok"
+
+    await store.execute("a", 1, "bid", {}, action)
+    await store.execute("b", 1, "bid", {}, action)
+    await store.execute("c", 1, "bid", {}, action)
+
+    # expired entries are dropped before the size cap is even reached
+    assert len(store) == 1
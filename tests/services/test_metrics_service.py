@@ -0,0 +1,54 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from services.metrics_service import Histogram, Metrics
+
+
+def test_histogram_percentiles():
+    histogram = Histogram([1, 10, 100])
+    for value in [0.5] * 90 + [5] * 9 + [500]:
+        histogram.observe(value)
+
+    assert histogram.count == 100
+    assert histogram.percentile(0.5) == 1
+    assert histogram.percentile(0.95) == 10
+    # slower than the last bucket, the max is reported
+    assert histogram.percentile(1) == 500
+    assert histogram.snapshot()["max_ms"] == 500
+
+
+def test_timer_records_stage():
+    metrics = Metrics(timings_enabled=True)
+    with metrics.timer("bid.commit"):
+        pass
+    with metrics.timer("bid.commit"):
+        pass
+
+    assert metrics.get_histogram("bid.commit").count == 2
+    assert metrics.snapshot()["timings"]["bid.commit"]["count"] == 2
+
+
+def test_disabled_timer_records_nothing():
+    metrics = Metrics(timings_enabled=False)
+    with metrics.timer("bid.commit"):
+        pass
+    metrics.observe("bid.sequencer_wait", 3)
+
+    assert metrics.get_histogram("bid.commit") is None
+    assert metrics.snapshot()["timings"] == {}
+
+
+def test_metrics_are_thread_safe():
+    metrics = Metrics(timings_enabled=True)
+
+    def record(worker: int):
+        for i in range(1000):
+            metrics.increment("settlement_jobs_done")
+            metrics.observe(f"stage.{worker}.{i % 50}", 1)
+            if i % 50 == 0:
+                metrics.snapshot()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(record, range(8)))
+
+    assert metrics.get_counter("settlement_jobs_done") == 8000
+    assert len(metrics.snapshot()["timings"]) == 400
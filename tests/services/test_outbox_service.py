@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+
+from services.outbox_service import get_outbox
+
+
+@pytest.mark.asyncio
+async def test_notifications_sent_only_after_commit():
+    from db_management.database_tests import override_get_db
+    session = next(override_get_db())
+    sent = []
+
+    async def notify(value):
+        sent.append(value)
+
+    get_outbox().stage(session, notify, 1)
+    get_outbox().stage(session, notify, 2)
+
+    # nothing is sent while the transaction is open
+    await asyncio.sleep(0.01)
+    assert sent == []
+
+    session.commit()
+    await asyncio.sleep(0.01)
+
+    # dispatched in the order they were staged
+    assert sent == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_notifications_dropped_on_rollback():
+    from db_management.database_tests import override_get_db
+    session = next(override_get_db())
+    sent = []
+
+    async def notify(value):
+        sent.append(value)
+
+    # the transaction is open once something has been executed in it
+    session.execute(select(1))
+    get_outbox().stage(session, notify, 1)
+    session.rollback()
+    session.commit()
+    await asyncio.sleep(0.01)
+
+    assert sent == []
+
+
+@pytest.mark.asyncio
+async def test_stop_waits_for_the_dispatcher():
+    from db_management.database_tests import override_get_db
+    session = next(override_get_db())
+    sent = []
+
+    async def notify(value):
+        sent.append(value)
+
+    get_outbox().stage(session, notify, 1)
+    session.commit()
+    dispatcher_task = get_outbox().dispatcher_task
+    await asyncio.sleep(0.01)
+
+    await get_outbox().stop()
+    assert dispatcher_task.done()
+
+    # started again by the next commit
+    get_outbox().stage(session, notify, 2)
+    session.commit()
+    await asyncio.sleep(0.01)
+    assert sent == [1, 2]
@@ -0,0 +1,317 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+import socketio
+from jose import jwt
+
+import services.socketio_service
+from db_management.database_tests import override_get_db, TestingAsyncSessionLocal
+from db_management.models import Auction, Product, Bid
+from response_models.auth_responses import SECRET_KEY, ALGORITHM
+from services.auction_cache_service import AuctionState, get_auction_cache, load_auction_snapshot
+from services.auction_event_service import AuctionEventLog, get_auction_event_log
+from services.broadcast_service import InMemoryBroker, InMemoryManager, create_client_manager
+from services.socketio_service import sio, SocketManager, SocketUser, PriceUpdateThrottle, connect, disconnect, \
+    resync, user_room
+from utils.constants import WebSocketAction, AuctionType, AuctionStatus
+
+
+@pytest.fixture(autouse=True)
+def event_log():
+    get_auction_event_log().auctions.clear()
+
+
+@pytest.fixture
+def database(monkeypatch):
+    monkeypatch.setattr(services.socketio_service, "async_session_maker", TestingAsyncSessionLocal)
+    return next(override_get_db())
+
+
+def create_auction(session, name: str, end_date: datetime | None = None, price: float = 12.5,
+                   event_seq: int = 0) -> Auction:
+    auction = Auction(auction_type=AuctionType.BID, end_date=end_date or datetime.now() + timedelta(days=1),
+                      product=Product(name=name, description="Followed auction", category_id=1),
+                      seller_id=pytest.company_account_id, bid=Bid(current_bid_value=price), event_seq=event_seq)
+    session.add(auction)
+    session.commit()
+    return auction
+
+
+@pytest.mark.asyncio
+async def test_auction_ended_tears_down_the_room(monkeypatch, database):
+    emitted = []
+
+    async def emit(event, data=None, room=None, **kwargs):
+        emitted.append((event, data, room))
+
+    monkeypatch.setattr(sio, "emit", emit)
+    manager = SocketManager()
+    ending = create_auction(database, "Figa")
+    other = create_auction(database, "Daktyl")
+    users = []
+    for eio_sid in ("eio-1", "eio-2"):
+        user = SocketUser(await sio.manager.connect(eio_sid, '/'))
+        manager.add_user(user.sid, user)
+        await user.follow_auction(ending.id)
+        await user.follow_auction(other.id)
+        users.append(user)
+
+    await manager.auction_ended_action(ending.id, 25.0, 3, 4)
+
+    ended = [(data, room) for event, data, room in emitted if event == WebSocketAction.AUCTION_ENDED]
+    assert ended == [({"price": 25.0, "winner_id": 3, "seq": 4}, ending.id)]
+    assert list(sio.manager.get_participants('/', ending.id)) == []
+    assert len(list(sio.manager.get_participants('/', other.id))) == 2
+    assert all(user.followed_auctions == [other.id] for user in users)
+
+    for user in users:
+        await sio.manager.disconnect(user.sid, '/')
+
+
+@pytest.mark.asyncio
+async def test_follower_gets_a_snapshot(monkeypatch, database):
+    emitted = []
+
+    async def emit(event, data=None, room=None, **kwargs):
+        emitted.append((event, data, room))
+
+    monkeypatch.setattr(sio, "emit", emit)
+    auction = create_auction(database, "Limonka")
+    ended = create_auction(database, "Mandarynka", end_date=datetime.now() - timedelta(minutes=1))
+    user = SocketUser(await sio.manager.connect("eio-snapshot", '/'))
+
+    await user.follow_auction(auction.id)
+    snapshots = [(data, room) for event, data, room in emitted if event == WebSocketAction.AUCTION_SNAPSHOT]
+    assert snapshots == [({"auction_id": auction.id, "price": 12.5, "winner_id": None,
+                           "end_date": auction.end_date.isoformat(), "bid_count": 0, "is_auction_finished": False,
+                           "seq": 0}, user.sid)]
+    assert user.sid in [sid for sid, _ in sio.manager.get_participants('/', auction.id)]
+
+    # an ended auction is not followed, the snapshot says it is over
+    await user.follow_auction(ended.id)
+    assert emitted[-1][0] == WebSocketAction.AUCTION_SNAPSHOT and emitted[-1][1]["is_auction_finished"]
+    assert user.followed_auctions == [auction.id]
+
+    await sio.manager.disconnect(user.sid, '/')
+
+
+@pytest.mark.asyncio
+async def test_snapshot_includes_everything_up_to_its_seq(monkeypatch, database):
+    emitted = []
+
+    async def emit(event, data=None, room=None, **kwargs):
+        emitted.append((event, data, room))
+
+    auction = create_auction(database, "Granat", event_seq=2)
+
+    async def bid_then_load(session, auction_id):
+        # a bid commits and announces itself while the follower is joining
+        auction.bid.current_bid_value = 14
+        auction.event_seq += 1
+        database.commit()
+        await SocketManager.send_auction_event(auction_id, WebSocketAction.BID_PRICE_UPDATE, {"price": 14}, 3)
+        return await load_auction_snapshot(session, auction_id)
+
+    monkeypatch.setattr(sio, "emit", emit)
+    monkeypatch.setattr(services.socketio_service, "load_auction_snapshot", bid_then_load)
+    user = SocketUser(await sio.manager.connect("eio-race", '/'))
+
+    await user.follow_auction(auction.id)
+
+    # the update reached the client through the room, the snapshot has its price and its seq
+    update = next(data for event, data, room in emitted if event == WebSocketAction.BID_PRICE_UPDATE)
+    snapshot = next(data for event, data, room in emitted if event == WebSocketAction.AUCTION_SNAPSHOT)
+    assert snapshot["seq"] == update["seq"] == 3 and snapshot["price"] == 14
+    assert user.sid in [sid for sid, _ in sio.manager.get_participants('/', auction.id)]
+
+    await sio.manager.disconnect(user.sid, '/')
+
+
+@pytest.mark.asyncio
+async def test_snapshot_is_read_from_the_database(monkeypatch, database):
+    emitted = []
+
+    async def emit(event, data=None, room=None, **kwargs):
+        emitted.append((event, data, room))
+
+    monkeypatch.setattr(sio, "emit", emit)
+    auction = create_auction(database, "Papaja", price=20, event_seq=3)
+    # the cache of this node is still behind bids made on another node
+    stale = AuctionState(auction.id, AuctionType.BID, AuctionStatus.ACTIVE, pytest.company_account_id,
+                         auction.end_date, 12.5, None, 0)
+    get_auction_cache().put(stale)
+    user = SocketUser(await sio.manager.connect("eio-db-snapshot", '/'))
+
+    # after a restart the event log is empty, the seq still comes from the database
+    await user.follow_auction(auction.id)
+    # once the log holds the events of other nodes, it still does not decide the seq
+    await SocketManager.send_auction_event(auction.id, WebSocketAction.BID_PRICE_UPDATE, {"price": 20}, 3)
+    user.forget_auction(auction.id)
+    await user.follow_auction(auction.id)
+
+    snapshots = [data for event, data, room in emitted if event == WebSocketAction.AUCTION_SNAPSHOT]
+    assert [(snapshot["price"], snapshot["seq"]) for snapshot in snapshots] == [(20, 3), (20, 3)]
+    assert get_auction_cache().get(auction.id).price == 20
+
+    await sio.manager.disconnect(user.sid, '/')
+
+
+@pytest.mark.asyncio
+async def test_user_push_reaches_every_connection(monkeypatch):
+    sent = []
+
+    async def send_eio_packet(eio_sid, pkt):
+        sent.append(eio_sid)
+
+    monkeypatch.setattr(sio, "_send_eio_packet", send_eio_packet)
+    sids = {}
+    for eio_sid, user_id in (("eio-tab-1", 1), ("eio-tab-2", 1), ("eio-tab-3", 2)):
+        sids[eio_sid] = await sio.manager.connect(eio_sid, '/')
+        await connect(sids[eio_sid], {"HTTP_AUTHORIZATION": jwt.encode({"sub": "user", "id": user_id}, SECRET_KEY,
+                                                                       algorithm=ALGORITHM)})
+
+    await SocketManager.bid_winner_update_action(1)
+    await asyncio.sleep(0)
+    assert sorted(sent) == ["eio-tab-1", "eio-tab-2"]
+
+    for eio_sid in ("eio-tab-1", "eio-tab-3"):
+        await disconnect(sids[eio_sid])
+        await sio.manager.disconnect(sids[eio_sid], '/')
+    assert [eio_sid for _, eio_sid in sio.manager.get_participants('/', user_room(1))] == ["eio-tab-2"]
+    assert list(sio.manager.get_participants('/', user_room(2))) == []
+
+    await disconnect(sids["eio-tab-2"])
+    await sio.manager.disconnect(sids["eio-tab-2"], '/')
+
+
+@pytest.mark.asyncio
+async def test_emits_reach_clients_of_other_servers():
+    broker = InMemoryBroker()
+    logs = [AuctionEventLog(), AuctionEventLog()]
+    servers = [socketio.AsyncServer(client_manager=InMemoryManager(broker, event_log=log)) for log in logs]
+    sent = {0: [], 1: []}
+    for i, server in enumerate(servers):
+        async def send_eio_packet(eio_sid, pkt, i=i):
+            sent[i].append((eio_sid, pkt.data))
+
+        server._send_eio_packet = send_eio_packet
+        server.manager_initialized = True
+        server.manager.initialize()
+    await asyncio.sleep(0)
+
+    # each client connected to a different server, both following the same auction
+    for i, server in enumerate(servers):
+        sid = await server.manager.connect(f"eio-{i}", '/')
+        await server.enter_room(sid, 7)
+
+    await servers[0].emit(WebSocketAction.BID_PRICE_UPDATE, data={"price": 10}, room=7)
+    await asyncio.sleep(0.05)
+    assert [eio_sid for eio_sid, _ in sent[0]] == ["eio-0"]
+    assert [eio_sid for eio_sid, _ in sent[1]] == ["eio-1"]
+
+    # auction events of the other servers are kept for resyncs too
+    await servers[0].emit(WebSocketAction.BID_PRICE_UPDATE, data={"price": 11, "seq": 4}, room=7)
+    await asyncio.sleep(0.05)
+    assert logs[1].events_after(7, 3) == [{"event": "bid_price_update", "data": {"price": 11, "seq": 4}}]
+    # the sending server adds its own events itself
+    assert len(logs[0]) == 0
+
+    # closing the room on one server closes it everywhere
+    await servers[1].close_room(7)
+    await asyncio.sleep(0.05)
+    assert all(list(server.manager.get_participants('/', 7)) == [] for server in servers)
+
+    for server in servers:
+        server.manager.thread.cancel()
+
+
+def test_client_manager_from_url():
+    assert create_client_manager("") is None
+    assert isinstance(create_client_manager("memory://"), InMemoryManager)
+    with pytest.raises(ValueError):
+        create_client_manager("kafka://localhost:9092")
+
+
+@pytest.mark.asyncio
+async def test_price_updates_are_coalesced():
+    sent = []
+
+    async def send(auction_id, price, seq, replaced_seqs):
+        sent.append((auction_id, price, seq, replaced_seqs))
+
+    throttle = PriceUpdateThrottle(send, max_rate=10)
+
+    # a bidding war on one auction, a single bid on another
+    for price in range(1, 6):
+        await throttle.update(1, price, price)
+    await throttle.update(2, 50, 1)
+    assert sent == [(1, 1, 1, []), (2, 50, 1, [])]
+
+    # only the latest price is sent once the interval has passed, it stands for the ones it has replaced
+    await asyncio.sleep(0.15)
+    assert sent == [(1, 1, 1, []), (2, 50, 1, []), (1, 5, 5, [2, 3, 4])]
+
+    await asyncio.sleep(0.15)
+    assert len(throttle) == 0
+    await throttle.update(1, 6, 6)
+    await throttle.update(1, 7, 7)
+
+    # an ended auction gets its final price right away
+    await throttle.flush(1)
+    assert sent[-2:] == [(1, 6, 6, []), (1, 7, 7, [])]
+    await asyncio.sleep(0.15)
+    assert len(sent) == 5
+
+
+@pytest.mark.asyncio
+async def test_missed_events_are_resent(monkeypatch, database):
+    async def emit(event, data=None, room=None, **kwargs):
+        pass
+
+    monkeypatch.setattr(sio, "emit", emit)
+    auction = create_auction(database, "Kiwi", event_seq=2)
+    sid = await sio.manager.connect("eio-resync", '/')
+    await connect(sid, {"HTTP_AUTHORIZATION": jwt.encode({"sub": "user", "id": 1}, SECRET_KEY, algorithm=ALGORITHM)})
+
+    await SocketManager.send_bid_price_update(auction.id, 13, 1, [])
+    await SocketManager.auction_extended_action(auction.id, datetime(2030, 1, 1), 2)
+
+    answer = await resync(sid, {"auction_id": auction.id, "seq": 1})
+    assert answer == {"auction_id": auction.id, "events": [
+        {"event": WebSocketAction.AUCTION_EXTENDED.value, "data": {"end_date": "2030-01-01T00:00:00", "seq": 2}}
+    ]}
+
+    # a seq the server does not know (e.g. from before a restart) gets a snapshot instead
+    answer = await resync(sid, {"auction_id": auction.id, "seq": 5})
+    assert answer["snapshot"]["seq"] == 2
+
+    await disconnect(sid)
+    await sio.manager.disconnect(sid, '/')
+
+
+@pytest.mark.asyncio
+async def test_resync_snapshot_seq_matches_its_state(monkeypatch, database):
+    async def emit(event, data=None, room=None, **kwargs):
+        pass
+
+    monkeypatch.setattr(sio, "emit", emit)
+    auction = create_auction(database, "Liczi", event_seq=4)
+    sid = await sio.manager.connect("eio-resync-race", '/')
+    await connect(sid, {"HTTP_AUTHORIZATION": jwt.encode({"sub": "user", "id": 1}, SECRET_KEY, algorithm=ALGORITHM)})
+
+    async def bid_then_load(session, auction_id):
+        # the missed events are gone, a bid commits and is sent before the snapshot is read
+        auction.bid.current_bid_value = 30
+        auction.event_seq += 1
+        database.commit()
+        await SocketManager.send_bid_price_update(auction_id, 30, 5, [])
+        return await load_auction_snapshot(session, auction_id)
+
+    monkeypatch.setattr(services.socketio_service, "load_auction_snapshot", bid_then_load)
+
+    answer = await resync(sid, {"auction_id": auction.id, "seq": 2})
+    assert answer["snapshot"]["price"] == 30 and answer["snapshot"]["seq"] == 5
+
+    await disconnect(sid)
+    await sio.manager.disconnect(sid, '/')
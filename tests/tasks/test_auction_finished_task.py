@@ -0,0 +1,131 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import repos.auction_repo
+from db_management.dto import CreateAuction, CreateAuctionProduct
+from db_management.models import SettlementJob
+from services.auction_service import create_auction
+from tasks.auction_finished_task import AuctionExpiryTracker, get_expiry_tracker, REMINDER, END
+from tasks.settlement_task import get_settlement_runner
+from utils.constants import AuctionType, SettlementJobStatus
+
+
+class RecordingTracker(AuctionExpiryTracker):
+    def __init__(self, expected: int, reminder_lead: float = 0):
+        super().__init__(reminder_lead)
+        self.ended = []
+        self.reminded = []
+        self.woken_at = {}
+        self.expected = expected
+        self.done = threading.Event()
+
+    def _wake(self, due: list[tuple[int, int]]) -> None:
+        reminders = sorted(auction_id for kind, auction_id in due if kind == REMINDER)
+        if reminders:
+            self.reminded.append(reminders)
+        for kind, auction_id in due:
+            if kind == END:
+                self.ended.append(auction_id)
+                self.woken_at[auction_id] = datetime.now()
+        if len(self.ended) == self.expected:
+            self.done.set()
+
+
+def test_runner_is_woken_up_at_end_dates():
+    tracker = RecordingTracker(expected=3)
+    now = datetime.now()
+    tracker.track(1, now + timedelta(seconds=0.6))
+    tracker.track(2, now + timedelta(seconds=0.3))
+    tracker.track(4, now + timedelta(seconds=0.4))
+    tracker.start()
+
+    # tracked while the worker is already sleeping for a later auction
+    tracker.track(3, now + timedelta(seconds=0.1))
+    # removed ones (e.g. bought) wake nobody up
+    tracker.untrack(4)
+
+    try:
+        assert tracker.done.wait(5)
+    finally:
+        tracker.stop()
+
+    assert tracker.ended == [3, 2, 1]
+    assert len(tracker) == 0
+    assert tracker.woken_at[1] - (now + timedelta(seconds=0.6)) < timedelta(seconds=1)
+
+
+def test_rescheduled_auction_wakes_up_once_at_the_new_date():
+    tracker = RecordingTracker(expected=1)
+    tracker.track(1, datetime.now() + timedelta(seconds=0.1))
+    tracker.track(1, datetime.now() + timedelta(seconds=0.3))
+    tracker.start()
+
+    try:
+        assert tracker.done.wait(5)
+        time.sleep(0.1)
+    finally:
+        tracker.stop()
+
+    assert tracker.ended == [1]
+
+
+def test_runner_is_woken_up_for_reminders():
+    tracker = RecordingTracker(expected=4, reminder_lead=0.3)
+    now = datetime.now()
+    tracker.track(1, now + timedelta(seconds=0.5))
+    tracker.track(2, now + timedelta(seconds=0.5))
+    # too late for a reminder
+    tracker.track(3, now + timedelta(seconds=0.1))
+    tracker.track(4, now + timedelta(seconds=0.5))
+    tracker.untrack(4)
+    tracker.track(5, now + timedelta(seconds=0.5))
+    assert len(tracker.reminders) == 3
+    tracker.start()
+
+    try:
+        assert tracker.done.wait(5)
+    finally:
+        tracker.stop()
+
+    # reminders due together wake the runner up once, before the auctions end
+    assert tracker.reminded == [[1, 2, 5]]
+    assert tracker.ended == [3, 1, 2, 5]
+    assert not tracker.reminders
+
+
+def test_due_entries_wake_up_the_settlement_runner():
+    runner = get_settlement_runner()
+    runner.wakeup.clear()
+
+    AuctionExpiryTracker()._wake([(END, 1)])
+    assert runner.wakeup.is_set()
+
+
+def test_created_auction_is_queued_with_the_auction():
+    from db_management.database_tests import override_get_db
+    session = next(override_get_db())
+    tracker = get_expiry_tracker()
+
+    auction_data = CreateAuction(
+        auction_type=AuctionType.BUY_NOW,
+        end_date=datetime.now() + timedelta(days=2),
+        price=5,
+        product=CreateAuctionProduct(name="Sliwka", description="Queued auction", category_id=1,
+                                     images=["http://res.cloudinary.com/sample-image.jpg"]),
+    )
+    create_auction(session, auction_data, pytest.company_account_id)
+
+    # the job is stored with the auction, the tracker only knows when to wake the runner up
+    auction = repos.auction_repo.search_auctions_by_name(session, "Sliwka")[0]
+    job = session.query(SettlementJob).where(SettlementJob.auction_id == auction.id).one()
+    assert (job.status, job.run_at) == (SettlementJobStatus.PENDING, auction_data.end_date)
+    assert tracker.tracked_auctions[auction.id] == auction_data.end_date
+
+    # startup reload reads the same auctions through the (id, end_date) projection
+    end_dates = dict(repos.auction_repo.get_active_auction_end_dates(session))
+    assert end_dates[auction.id] == auction_data.end_date
+    assert all(tracker.tracked_auctions[auction_id] == end_date for auction_id, end_date in end_dates.items()
+               if auction_id in tracker.tracked_auctions)
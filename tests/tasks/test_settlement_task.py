@@ -0,0 +1,269 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pytest
+
+import repos.settlement_repo
+import services.auction_service
+import services.email_service
+import tasks.settlement_task
+from db_management.database_tests import session_maker
+from db_management.models import Auction, Bid, Product, SettlementJob
+from services.metrics_service import get_metrics
+from tasks.settlement_task import SettlementRunner
+from utils.constants import AuctionType, AuctionStatus, SettlementJobStatus, SETTLEMENT_WORKERS
+
+
+def create_ended_auction(session, name: str) -> Auction:
+    auction = Auction(auction_type=AuctionType.BID, end_date=datetime.now() - timedelta(minutes=1),
+                      product=Product(name=name, description="Ended auction", category_id=1),
+                      seller_id=pytest.company_account_id, bid=Bid(current_bid_value=5))
+    session.add(auction)
+    session.commit()
+    return auction
+
+
+def get_job(session, auction_id: int) -> SettlementJob:
+    session.expire_all()
+    return session.query(SettlementJob).where(SettlementJob.auction_id == auction_id).first()
+
+
+def test_job_runs_once_on_the_leader():
+    node_a = SettlementRunner(session_maker, "node-a")
+    node_b = SettlementRunner(session_maker, "node-b")
+
+    # only one node at a time drives the settlement
+    assert node_a.renew_leadership()
+    assert not node_b.renew_leadership()
+    assert node_a.renew_leadership()
+
+    with session_maker() as session:
+        auction = create_ended_auction(session, "Ananas")
+
+        # every node tracking the auction queues it, there is still a single job
+        node_a.enqueue(auction.id)
+        node_b.enqueue(auction.id)
+        assert session.query(SettlementJob).where(SettlementJob.auction_id == auction.id).count() == 1
+
+        jobs = node_a.claim_jobs()
+        assert [auction_id for _, auction_id in jobs] == [auction.id]
+        assert node_b.claim_jobs() == []
+
+        node_a.run_job(*jobs[0])
+        assert get_job(session, auction.id).status == SettlementJobStatus.DONE
+        session.refresh(auction)
+        assert auction.auction_status == AuctionStatus.INACTIVE
+
+        # running it again (e.g. after a crash before the job was marked done) changes nothing
+        node_a.run_job(*jobs[0])
+        assert get_job(session, auction.id).status == SettlementJobStatus.DONE
+
+    # stopping hands the leadership over right away
+    node_a.stop()
+    assert node_b.renew_leadership()
+    node_b.stop()
+
+
+def test_failed_job_is_retried_with_backoff():
+    runner = SettlementRunner(session_maker, "node-a")
+    missing_auction_id = 1000000
+
+    runner.enqueue(missing_auction_id)
+    jobs = [job for job in runner.claim_jobs() if job[1] == missing_auction_id]
+    runner.run_job(*jobs[0])
+
+    with session_maker() as session:
+        job = get_job(session, missing_auction_id)
+        assert job.status == SettlementJobStatus.PENDING
+        assert job.attempts == 1
+        assert job.run_at > datetime.now()
+        assert job.last_error == "Auction not found"
+
+    # not claimed again before its retry time
+    assert missing_auction_id not in [auction_id for _, auction_id in runner.claim_jobs()]
+
+
+def test_job_of_a_dead_node_is_taken_over():
+    with session_maker() as session:
+        auction = create_ended_auction(session, "Kokos")
+        repos.settlement_repo.enqueue_settlement_job(session, auction.id, datetime.now())
+        session.commit()
+
+        # node-a claims the job and dies, its claim runs out
+        now = datetime.now()
+        claimed = repos.settlement_repo.claim_due_jobs(session, "node-a", now, -1, 100)
+        job_id = next(job_id for job_id, auction_id in claimed if auction_id == auction.id)
+        session.commit()
+
+        claimed = repos.settlement_repo.claim_due_jobs(session, "node-b", now, 60, 100)
+        assert (job_id, auction.id) in claimed
+        session.commit()
+
+        # node-a coming back can no longer change the job
+        assert not repos.settlement_repo.complete_job(session, job_id, "node-a")
+        assert repos.settlement_repo.complete_job(session, job_id, "node-b")
+        session.commit()
+
+
+def test_extended_auction_is_settled_at_its_new_end_date():
+    runner = SettlementRunner(session_maker, "node-a")
+
+    with session_maker() as session:
+        auction = create_ended_auction(session, "Brzoskwinia")
+        runner.enqueue(auction.id)
+
+        # extended on another node after this one had queued it at the old end date
+        new_end_date = datetime.now() + timedelta(minutes=1)
+        auction.end_date = new_end_date
+        session.commit()
+
+        jobs = [job for job in runner.claim_jobs() if job[1] == auction.id]
+        runner.run_job(*jobs[0])
+
+        job = get_job(session, auction.id)
+        assert job.status == SettlementJobStatus.PENDING
+        assert job.run_at == new_end_date
+        assert job.attempts == 0
+        session.refresh(auction)
+        assert auction.auction_status == AuctionStatus.ACTIVE
+
+
+def test_failing_email_does_not_fail_the_settlement(monkeypatch):
+    sent = []
+
+    def failing_email(*args):
+        raise RuntimeError("SendGrid is down")
+
+    monkeypatch.setattr(services.email_service, "send_user_won_auction_email", failing_email)
+    monkeypatch.setattr(services.email_service, "send_seller_auction_completed_email", lambda *args: sent.append(1))
+    runner = SettlementRunner(session_maker, "node-a")
+
+    with session_maker() as session:
+        auction = create_ended_auction(session, "Pomarancza")
+        auction.bid.current_bid_winner_id = pytest.user_id
+        session.commit()
+
+        runner.enqueue(auction.id)
+        jobs = [job for job in runner.claim_jobs() if job[1] == auction.id]
+        runner.run_job(*jobs[0])
+
+        # the other email still goes out, the job is not retried
+        assert sent == [1]
+        assert get_job(session, auction.id).status == SettlementJobStatus.DONE
+        session.refresh(auction)
+        assert auction.auction_status == AuctionStatus.INACTIVE
+
+
+class SlowRunner(SettlementRunner):
+    def __init__(self):
+        super().__init__(session_maker, "node-slow")
+        self.settled = []
+
+    def run_job(self, job_id: int, auction_id: int) -> None:
+        time.sleep(0.3)  # e.g. sending emails
+        self.settled.append(auction_id)
+
+
+def test_auctions_ending_together_are_settled_concurrently():
+    runner = SlowRunner()
+    runner.executor = ThreadPoolExecutor(max_workers=SETTLEMENT_WORKERS)
+
+    start = time.perf_counter()
+    for auction_id in range(8):
+        runner._submit(auction_id, auction_id)
+    runner.executor.shutdown(wait=True)
+
+    # one slow settlement does not hold back the others
+    assert sorted(runner.settled) == list(range(8))
+    assert runner.in_flight == 0
+    assert time.perf_counter() - start < 8 * 0.3
+
+
+def test_catch_up_settles_overdue_auctions_in_batches(monkeypatch):
+    monkeypatch.setattr(tasks.settlement_task, "CATCH_UP_BATCH_SIZE", 2)
+    runner = SettlementRunner(session_maker, "node-a")
+
+    with session_maker() as session:
+        unsold = [create_ended_auction(session, "Arbuz"), create_ended_auction(session, "Melon")]
+        sold = create_ended_auction(session, "Mango")
+        sold.bid.current_bid_winner_id = pytest.user_id
+        session.commit()
+
+        runner.catch_up(datetime.now())
+
+        # auctions without a winner are closed right away, the others wait for their settlement job
+        for auction in unsold + [sold]:
+            session.refresh(auction)
+        assert [auction.auction_status for auction in unsold] == [AuctionStatus.INACTIVE] * 2
+        assert sold.auction_status == AuctionStatus.ACTIVE
+        assert get_job(session, sold.id).status == SettlementJobStatus.PENDING
+
+    metrics = get_metrics()
+    assert metrics.get_gauge("catch_up_processed") == metrics.get_gauge("catch_up_total") >= 3
+
+
+class RecordingOutbox:
+    def __init__(self):
+        self.published = []
+
+    def stage(self, session, action, *args):
+        self.published.append(args)
+
+    def publish(self, actions):
+        self.published.extend(args for _, args in actions)
+
+
+@pytest.mark.parametrize("update_returning", [True, False])
+def test_expired_buy_now_auction_is_closed_by_its_job(monkeypatch, update_returning):
+    outbox = RecordingOutbox()
+    monkeypatch.setattr(services.auction_service, "get_outbox", lambda: outbox)
+    runner = SettlementRunner(session_maker, "node-a")
+
+    with session_maker() as session:
+        monkeypatch.setattr(session.get_bind().dialect, "update_returning", update_returning)
+        unsold, bought = [Auction(auction_type=AuctionType.BUY_NOW, end_date=datetime.now(), buy_now_price=10,
+                                  product=Product(name=f"{name} {update_returning}", description="Expired buy now",
+                                                  category_id=1),
+                                  seller_id=pytest.company_account_id, bid=Bid(current_bid_value=0))
+                          for name in ("Wisnia", "Malina")]
+        bought.auction_status = AuctionStatus.INACTIVE
+        session.add_all([unsold, bought])
+        session.commit()
+
+        for auction in (unsold, bought):
+            runner.enqueue(auction.id)
+        jobs = [job for job in runner.claim_jobs() if job[1] in (unsold.id, bought.id)]
+        for job in jobs:
+            runner.run_job(*job)
+        # running it again (e.g. after a lost claim) announces nothing more
+        runner.run_job(*jobs[0])
+
+        # only the auction closed here ends unsold, the other one has been bought
+        assert outbox.published == [(unsold.id, None, None, 1)]
+        assert [get_job(session, auction.id).status for auction in (unsold, bought)] == [SettlementJobStatus.DONE] * 2
+        session.refresh(unsold)
+        assert unsold.auction_status == AuctionStatus.INACTIVE
+
+
+def test_reminder_is_sent_by_a_single_node(monkeypatch):
+    outbox = RecordingOutbox()
+    monkeypatch.setattr(tasks.settlement_task, "get_outbox", lambda: outbox)
+
+    with session_maker() as session:
+        end_date = datetime.now() + timedelta(minutes=3)
+        auction = Auction(auction_type=AuctionType.BID, end_date=end_date,
+                          product=Product(name="Porzeczka", description="Ending soon", category_id=1),
+                          seller_id=pytest.company_account_id, bid=Bid(current_bid_value=5))
+        later = Auction(auction_type=AuctionType.BID, end_date=end_date + timedelta(minutes=10),
+                        product=Product(name="Morwa", description="Ending later", category_id=1),
+                        seller_id=pytest.company_account_id, bid=Bid(current_bid_value=5))
+        session.add_all([auction, later])
+        session.commit()
+
+    # a node that has just lost the lead may still get here, the reminder is sent once
+    for node in (SettlementRunner(session_maker, "node-a", 5 * 60), SettlementRunner(session_maker, "node-b", 5 * 60)):
+        node.send_reminders()
+
+    reminded = [args for args in outbox.published if args[0] in (auction.id, later.id)]
+    assert reminded == [(auction.id, end_date, 1)]
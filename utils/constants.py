@@ -1,3 +1,4 @@
+import os
 import sys
 from enum import Enum
 
@@ -7,11 +8,45 @@ DOMAIN_BASE = "https://charfair.me"
 STRIPE_PAYMENT_SUCCESS_URL = DOMAIN_BASE + '/wallet/payment/success'
 STRIPE_PAYMENT_CANCEL_URL = DOMAIN_BASE + '/wallet/payment/cancel'
 STRIPE_LISTENING_EVENTS = ['charge.succeeded', 'payment_intent.succeeded', 'payment_intent.created', 'checkout.session.expired']
+BID_PLACEMENT_MAX_ATTEMPTS = 5  # compare-and-swap attempts before giving up on a contended auction
+PROXY_BID_INCREMENT = 1.0  # step used when the server raises a bid on behalf of a proxy bidder
+AUCTION_CACHE_MAX_SIZE = 1000  # hot auctions kept in memory, least recently used are evicted first
+AUCTION_CACHE_TTL = 5  # seconds a cached auction is trusted, bounds staleness caused by other workers
+IDEMPOTENCY_STORE_MAX_SIZE = 10000  # stored responses of requests sent with an Idempotency-Key header
+IDEMPOTENCY_KEY_TTL = 60 * 60  # seconds a retried request gets the stored response
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+EXPIRY_TRACKER_MAX_SLEEP = 60  # seconds the expiry tracker sleeps at most, even when no auction ends sooner
+SETTLEMENT_WORKERS = 8  # auctions settled concurrently when many of them end at the same time
+SETTLEMENT_POLL_INTERVAL = 1  # seconds between two looks at the settlement queue
+SETTLEMENT_JOB_LEASE = 5 * 60  # seconds a claimed job is reserved for its node, then it is considered lost
+SETTLEMENT_MAX_ATTEMPTS = 5
+SETTLEMENT_RETRY_BACKOFF = 10  # seconds before the first retry, doubled on every next one
+SETTLEMENT_RETRY_MAX_BACKOFF = 10 * 60
+CATCH_UP_BATCH_SIZE = 200  # overdue auctions settled per transaction after downtime
+LEADER_LEASE_TTL = 15  # seconds the settlement leader keeps its role without renewing it
+
+# soft close: a bid placed within the final SOFT_CLOSE_WINDOW seconds moves the end of the auction
+# to SOFT_CLOSE_EXTENSION seconds after the bid, 0 turns it off
+SOFT_CLOSE_WINDOW = int(os.getenv("SOFT_CLOSE_WINDOW", "60"))
+SOFT_CLOSE_EXTENSION = int(os.getenv("SOFT_CLOSE_EXTENSION", "60"))
+# followers are reminded AUCTION_ENDING_SOON_REMINDER seconds before the auction ends, 0 turns it off
+AUCTION_ENDING_SOON_REMINDER = int(os.getenv("AUCTION_ENDING_SOON_REMINDER", str(5 * 60)))
+# shared by all socket servers behind the load balancer (redis://, amqp:// or memory:// in a single process),
+# empty keeps every socket server on its own
+SOCKETIO_MESSAGE_QUEUE = os.getenv("SOCKETIO_MESSAGE_QUEUE", "")
+# bid_price_update events sent per second and auction, faster bids are coalesced into the latest price, 0 sends all
+BID_PRICE_UPDATES_PER_SECOND = float(os.getenv("BID_PRICE_UPDATES_PER_SECOND", "4"))
+AUCTION_EVENT_BUFFER_SIZE = 64  # latest events per auction kept for clients catching up
+AUCTION_EVENT_LOG_MAX_AUCTIONS = 10000
 
 
 class WebSocketAction(str, Enum):
     BID_PRICE_UPDATE = 'bid_price_update'
     BID_WINNER_UPDATE = 'bid_winner_update'
+    AUCTION_EXTENDED = 'auction_extended'
+    AUCTION_ENDING_SOON = 'auction_ending_soon'
+    AUCTION_ENDED = 'auction_ended'
+    AUCTION_SNAPSHOT = 'auction_snapshot'
 
 
 class TransactionStatus(str, Enum):
@@ -43,6 +78,13 @@ class AuctionStatus(str, Enum):
     CANCELLED = 'cancelled'
 
 
+class SettlementJobStatus(str, Enum):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+
 def initialize_logger():
     # Usuń domyślne wyjście do konsoli, aby uniknąć duplikatów
     logger.remove()